@@ -0,0 +1,250 @@
+#encoding: utf-8
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+
+from sho import make, algo, iters, num, bit, pb
+
+########################################################################
+# Measures
+########################################################################
+
+def measure(call, min_time, repeat=3):
+    """Return the number of calls per second of the given function,
+    called repeatedly during at least min_time seconds (the best of repeat times),
+    and the peak memory (in bytes) allocated by one call."""
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rates = []
+    for _ in range(repeat):
+        n = 0
+        start = time.perf_counter()
+        while True:
+            call()
+            n += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        rates.append(n / elapsed)
+    return np.max(rates), peak
+
+
+class counter:
+    """Objective function counting its evaluations
+    (one per solution of the population, for a batch objective function)."""
+
+    def __init__(self, func, batch=False):
+        self.func = func
+        self.batch = batch
+        self.calls = 0
+
+    def __call__(self, sol):
+        self.calls += len(sol) if self.batch else 1
+        return self.func(sol)
+
+
+########################################################################
+# Benchmarks
+########################################################################
+
+# Each benchmark makes, for a domain width w and a number of sensors n,
+# a function to be measured, which returns its number of objective function calls.
+
+def positions(w, n):
+    """n distinct random cells, as an (n,2) array of (x,y)."""
+    cells = np.random.choice(w*w, size=min(n, w*w), replace=False)
+    return np.stack((cells % w, cells // w), axis=-1)
+
+
+def num_sol(w, n):
+    return num.rand(2*n, w)
+
+
+def bit_sol(w, n):
+    domain = np.zeros((w,w))
+    pos = positions(w, n)
+    domain[pos[:,1], pos[:,0]] = 1
+    return domain
+
+
+def calls(f, evals):
+    """Make a benchmark calling f, which makes evals objective function calls."""
+    def g():
+        f()
+        return evals
+    return g
+
+
+def operators(w, n, rng):
+    """Benchmarks of the operators, drawing from rng."""
+    r = 0.3
+    sensors = [tuple(p) for p in positions(w, n)]
+    xs, bs = num_sol(w, n), bit_sol(w, n)
+    nb = int(np.sum(bs))
+    xpop = [num_sol(w, n) for _ in range(10)]
+    bpop = [bit_sol(w, n) for _ in range(10)]
+    xdict = {k: (xpop[k], 0) for k in range(len(xpop))}
+    xneig = make.neig(num.neighb_square, scale=0.3, domain_width=w, rng=rng)
+    bneig = make.neig(bit.neighb_square, scale=0.3, domain_width=w, rng=rng)
+    return {
+        "pb.coverage": calls(lambda: pb.coverage(np.zeros((w,w)), sensors, r*w), 1),
+        "num.cover_sum": calls(lambda: num.cover_sum(xs, w, r, 2*n), 1),
+        "bit.cover_sum": calls(lambda: bit.cover_sum(bs, w, r, 2*n), 1),
+        "num.cover_sum_batch": calls(lambda: num.cover_sum_batch(xpop, w, r, 2*n), len(xpop)),
+        "bit.cover_sum_batch": calls(lambda: bit.cover_sum_batch(bpop, w, r, 2*n), len(bpop)),
+        "num.neighb_square": calls(lambda: xneig(xs), 0),
+        "bit.neighb_square": calls(lambda: bneig(bs), 0),
+        "num.simple_crossover": calls(lambda: num.simple_crossover(xpop, xneig, 0, 0.5, n, rng=rng), 0),
+        "num.crossover": calls(lambda: num.crossover(xpop, 0, len(xpop), xneig, 0.5, n, rng=rng), 0),
+        "num.dict_crossover": calls(lambda: num.dict_crossover(xdict, list(xdict), xpop[0], 0, len(xpop), xneig, 0.5, n, rng=rng), 0),
+        "bit.simple_crossover": calls(lambda: bit.simple_crossover(bpop, bneig, 0, 0.5, nb, rng=rng), 0),
+        # The selected sample is appended at the end of the population.
+        "bit.crossover": calls(lambda: bit.crossover(bpop + bpop[:1], 0, len(bpop), bneig, 0.5, nb, rng=rng), 0),
+    }
+
+
+def templates(w, n, rng, nb_it=10):
+    """Benchmarks of the algorithm templates, running nb_it iterations
+    with the numeric encoding and drawing from rng."""
+    func = counter(make.func(num.cover_sum, domain_width=w, sensor_range=0.3, dim=2*n))
+    batch = counter(make.batch_func(num.cover_sum_batch, domain_width=w, sensor_range=0.3, dim=2*n), batch=True)
+    init = make.init(num.rand, dim=2*n, scale=w, rng=rng)
+    neighb = make.neig(num.neighb_square, scale=0.3, domain_width=w, rng=rng)
+    evo = dict(n_pop=20, n_ech=9, p_mut=0.8, p_cross=0.2, nb_sensors=n, rng=rng)
+
+    def run(template, *ops, **kwargs):
+        def f():
+            func.calls, batch.calls = 0, 0
+            template(func, *ops, make.iter(iters.max, nb_it=nb_it), **kwargs)
+            return func.calls + batch.calls
+        return f
+
+    return {
+        "algo.random": run(algo.random, init),
+        "algo.greedy": run(algo.greedy, init, neighb),
+        "algo.annealing": run(algo.annealing, init, neighb, temperature0=1000, Lambda=0.99, rng=rng),
+        "algo.tempering": run(algo.tempering, init, neighb, temperature0=1000, Lambda=0.99, n_replicas=4, batch_func=batch, rng=rng),
+        "algo.simple_evolution": run(algo.simple_evolution, init, neighb, simple_crossover=num.simple_crossover, **evo),
+        "algo.evolution": run(algo.evolution, init, neighb, crossover=num.crossover, **evo),
+        "algo.evolution+batch": run(algo.evolution, init, neighb, crossover=num.crossover, batch_func=batch, **evo),
+        "algo.dict_evolution": run(algo.dict_evolution, init, neighb, crossover=num.dict_crossover, **evo),
+        # Calls made in the islands' processes are not counted.
+        "algo.island_evolution": calls(run(algo.island_evolution, init, neighb, n_islands=2, period=5, n_migrants=1, topology="ring", crossover=num.crossover, batch_func=batch, **evo), None),
+    }
+
+
+def bench(widths, sensors, min_time, names=None):
+    """Measure all benchmarks (or those whose names start with one of names)
+    for all combinations of domain widths and numbers of sensors."""
+    results = []
+    for w in widths:
+        for n in sensors:
+            np.random.seed(0)
+            rng = np.random.default_rng(0)
+            cases = operators(w, n, rng)
+            cases.update(templates(w, n, rng))
+            for name, call in cases.items():
+                if names and not any(name.startswith(s) for s in names):
+                    continue
+                evals = []
+                rate, peak = measure(lambda: evals.append(call()), min_time)
+                res = {
+                    "name": name,
+                    "domain_width": w,
+                    "nb_sensors": n,
+                    "calls_per_sec": float(rate),
+                    "evals_per_sec": None if evals[-1] is None else rate * evals[-1],
+                    "peak_memory": peak,
+                }
+                results.append(res)
+                sys.stderr.write("{name} w={domain_width} n={nb_sensors}: {calls_per_sec:.1f} calls/s, {evals_per_sec} evals/s, {peak_memory} B\n".format(**res))
+    return results
+
+
+def commit():
+    """Current git commit, if any."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, tolerance):
+    """Return the list of the benchmarks of new being slower than those of old,
+    or allocating more memory (by more than 64 kB), by more than the given fraction."""
+    key = lambda r: (r["name"], r["domain_width"], r["nb_sensors"])
+    before = {key(r): r for r in old["results"]}
+    regressions = []
+    for r in new["results"]:
+        if key(r) not in before:
+            continue
+        b = before[key(r)]
+        speed = r["calls_per_sec"] / b["calls_per_sec"]
+        memory = r["peak_memory"] / max(1, b["peak_memory"])
+        slower = speed < 1 - tolerance
+        bigger = memory > 1 + tolerance and r["peak_memory"] - b["peak_memory"] > 2**16
+        print("{:<25} w={:<5} n={:<4} speed x{:<7.2f} memory x{:<7.2f} {}".format(
+            r["name"], r["domain_width"], r["nb_sensors"], speed, memory,
+            "REGRESSION" if slower or bigger else ""))
+        if slower or bigger:
+            regressions.append(key(r))
+    return regressions
+
+
+########################################################################
+# Interface
+########################################################################
+
+if __name__=="__main__":
+    import argparse
+
+    can = argparse.ArgumentParser(description="Measure the throughput of the operators and templates, or compare two measures.")
+
+    can.add_argument("-w", "--widths", metavar="NB", nargs="+", default=[30,100,300,1000], type=int,
+            help="Domain widths")
+
+    can.add_argument("-n", "--nb-sensors", metavar="NB", nargs="+", default=[1,10,50,200], type=int,
+            help="Numbers of sensors")
+
+    can.add_argument("-b", "--bench", metavar="NAME", nargs="+", default=None,
+            help="Only run benchmarks whose names start with NAME")
+
+    can.add_argument("-m", "--min-time", metavar="SEC", default=0.2, type=float,
+            help="Minimum duration of each measure (the best of three measures is kept)")
+
+    can.add_argument("-o", "--output", metavar="FILE", default="bench.json",
+            help="JSON file where to save results")
+
+    can.add_argument("-c", "--compare", metavar="FILE", nargs=2, default=None,
+            help="Compare two JSON results (old then new) instead of measuring, exit with an error if there are regressions")
+
+    can.add_argument("-l", "--tolerance", metavar="RATIO", default=0.2, type=float,
+            help="Relative slowdown or memory increase flagged as a regression")
+
+    the = can.parse_args()
+
+    if the.compare:
+        with open(the.compare[0]) as fd:
+            old = json.load(fd)
+        with open(the.compare[1]) as fd:
+            new = json.load(fd)
+        regressions = compare(old, new, the.tolerance)
+        print("{} regressions between {} and {}".format(len(regressions), old["commit"], new["commit"]))
+        sys.exit(1 if regressions else 0)
+
+    results = bench(the.widths, the.nb_sensors, the.min_time, the.bench)
+    with open(the.output, 'w') as fd:
+        json.dump({
+            "commit": commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "results": results,
+        }, fd, indent=1)
@@ -1,39 +1,68 @@
 #encoding: utf-8
-import os
-import csv
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 
 from sho import make, algo, iters, plot, num, bit, pb
+import snp
 
 nb_runs = 10
 
-def ert(nb_runs, nb_sensors, sensor_range, domain_width, iters, solver, target, steady_delta, variation_scale, treshold) :
+def trajectory(argv, seed):
+    """Run a solver of snp.py in the current process, with the given command line arguments and seed (or numpy.random.SeedSequence).
+    Return its trajectory, as an array of (evaluations, value) rows.
+    """
+    the = snp.arguments().parse_args(argv)
+    the.ert = True
+    steps = []
+    again = iters.pipeline(
+                nb_it = the.iters,
+                target = the.target,
+                nb_evals = the.budget,
+                delta = the.steady_delta,
+                epsilon = the.steady_epsilon,
+                hooks = [make.iter(iters.trajectory,
+                    trajectory = steps)])
+    snp.run(the, again, rng=np.random.default_rng(seed))
+    return np.array(steps)
+
+def campaign(nb_runs, argv, seed=None, workers=None):
+    """
+    Run nb_runs times the solver of snp.py with the given command line arguments, in a pool of workers processes (as many as cores by default).
+    Each run gets its own seed, derived from the given one. Return the list of trajectories, in the order of the runs.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(nb_runs)
+    with ProcessPoolExecutor(max_workers=workers) as pool :
+    	return list(pool.map(trajectory, [argv]*nb_runs, seeds))
+
+def load(filename):
+    """Read a trajectory saved by snp.py with --binary, as an array of (evaluations, value) rows."""
+    _, evals, vals, _ = iters.load(filename)
+    return np.stack((evals, vals), axis=-1)
+
+def ert(nb_runs, nb_sensors, sensor_range, domain_width, iters, solver, target, steady_delta, variation_scale, treshold, seed=None, workers=None) :
     """
     This function defines lists along the x and y axis useful for computing ERT. Those lists are field up through the different runs
     """
+    argv = ["--nb-sensors", str(nb_sensors), "--sensor-range", str(sensor_range), "--domain-width", str(domain_width), "--iters", str(iters), "--solver", solver, "--target", str(target), "--steady-delta", str(steady_delta), "--variation-scale", str(variation_scale)]
+    return ecdf(campaign(nb_runs, argv, seed, workers), treshold)
+
+def ecdf(trajectories, treshold) :
+    """
+    Compute the lists along the x and y axis of the ERT from the (evaluations, value) trajectories of the runs of a solver,
+    either computed by campaign or read by load.
+    """
+    nb_runs = len(trajectories)
     probabilities = []
     calls_list = []
-    for current_run in range(nb_runs) :
-    	# This part execute snp.py module
-    	os.system("python3 snp.py --nb-sensors " + nb_sensors + " --sensor-range " + sensor_range + " --domain-width " + domain_width + " --iters " + iters +  " --solver " + solver + " --target " + target + " --steady-delta " + steady_delta + " --variation-scale " + variation_scale + " --ert True")
-    	
-    	# Read the file generated by snp.py. We only consider the first two columns.
-     	fichier = []
-    	fichier_csv = csv.reader(open(solver + ".csv"), delimiter = ';')
-    	for row in fichier_csv :
-    		if len(row) == 3 :
-    			fichier.append([float(row[0]),float(row[1])])
-    	fichier = np.array(fichier)
+    # We only consider the iterations and the values of the trajectories.
+    for fichier in trajectories :
 
     	# Check if the result of this run is above the treshold
     	index_one_run = 0
     	calls_one_run = []
     	for i in range(len(fichier)) :
-    		if solver == "bit_evolution" or solver == "num_evolution" or solver == "bit_simple_evolution" or solver == "num_simple_evolution" :
-    			calls_one_run.append(np.multiply(fichier[i][0],10))
-    		else :
-    			calls_one_run.append(fichier[i][0])
+    		calls_one_run.append(fichier[i][0])
     		if fichier[i][1] >= treshold and index_one_run == 0 :
     			index_one_run = i
     			
@@ -80,6 +109,12 @@ if __name__ == "__main__" :
 
     can.add_argument("-a", "--variation-scale", metavar="RATIO", default=0.3, type=float,
             help="Scale of the variation operators (as a ration of the domain width)")
+
+    can.add_argument("-s", "--seed", metavar="VAL", default=None, type=int,
+            help="Random pseudo-generator seed of the campaign, from which the seeds of the runs are derived")
+
+    can.add_argument("-j", "--workers", metavar="NB", default=None, type=int,
+            help="Number of worker processes running in parallel (default to the number of cores)")
     
     tresholds = [650,662,670]
     
@@ -88,8 +123,8 @@ if __name__ == "__main__" :
     count_treshold = 1
     plt.figure(1)
     for treshold in tresholds :
-    	probabilities1, calls_list1 = ert(nb_runs, str(the.nb_sensors), str(the.sensor_range), str(the.domain_width), str(the.iters), "num_greedy", str(the.target), str(the.steady_delta), str(the.variation_scale), treshold)
-    	probabilities2, calls_list2 = ert(nb_runs, str(the.nb_sensors), str(the.sensor_range), str(the.domain_width), str(the.iters), "num_annealing", str(the.target), str(the.steady_delta), str(the.variation_scale), treshold)
+    	probabilities1, calls_list1 = ert(nb_runs, str(the.nb_sensors), str(the.sensor_range), str(the.domain_width), str(the.iters), "num_greedy", str(the.target), str(the.steady_delta), str(the.variation_scale), treshold, the.seed, the.workers)
+    	probabilities2, calls_list2 = ert(nb_runs, str(the.nb_sensors), str(the.sensor_range), str(the.domain_width), str(the.iters), "num_annealing", str(the.target), str(the.steady_delta), str(the.variation_scale), treshold, the.seed, the.workers)
 
     	plt.subplot(2,2,count_treshold)
     	plt.xlim(right=max(calls_list1[-1],calls_list2[-2]))
@@ -104,7 +139,7 @@ if __name__ == "__main__" :
     	count_treshold += 1
 
     treshold = 665
-    probabilities0, calls_list0 = ert(nb_runs, str(the.nb_sensors), str(the.sensor_range), str(the.domain_width), str(the.iters), "num_simple_evolution", str(the.target), str(the.steady_delta), str(the.variation_scale), treshold)
+    probabilities0, calls_list0 = ert(nb_runs, str(the.nb_sensors), str(the.sensor_range), str(the.domain_width), str(the.iters), "num_simple_evolution", str(the.target), str(the.steady_delta), str(the.variation_scale), treshold, the.seed, the.workers)
 
     plt.figure(2)
     plt.plot(calls_list0, probabilities0, label="Evolutionary algorithm")
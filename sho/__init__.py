@@ -7,6 +7,7 @@ __all__ = [
        'iters',
        'num',
        'bit',
+       'sparse',
        'plot',
        'pb',
    ]
@@ -1,17 +1,41 @@
 ########################################################################
 # Algorithms
 ########################################################################
+import bisect
+import multiprocessing
 import numpy as np
 
+from . import make
+
+class uniforms:
+    """Uniform random numbers in [0,1), pre-drawn from rng by blocks of size,
+    for loops drawing one number at a time."""
+
+    def __init__(self, rng, size=1024):
+        self.rng = rng
+        self.size = size
+        self.block = []
+        self.k = 0
+
+    def __call__(self):
+        if self.k == len(self.block):
+            self.block = self.rng.random(self.size).tolist()
+            self.k = 0
+        self.k += 1
+        return self.block[self.k-1]
+
+
 def random(func, init, again):
     """Iterative random search template."""
     best_sol = init()
     best_val = func(best_sol)
     val,sol = best_val,best_sol
     i = 0
-    while again(i, best_val, best_sol):
+    nb_evals = 1
+    while again(i, best_val, best_sol, nb_evals):
         sol = init()
         val = func(sol)
+        nb_evals += 1
         if val >= best_val:
             best_val = val
             best_sol = sol
@@ -20,163 +44,523 @@ def random(func, init, again):
 
 
 def greedy(func, init, neighb, again):
-    """Iterative randomized greedy heuristic template."""
+    """Iterative randomized greedy heuristic template.
+
+    If func implements the move interface (see pb.coverage_counts),
+    neighbors are evaluated incrementally from the current solution."""
+    delta = hasattr(func, "move")
     best_sol = init()
-    best_val = func(best_sol)
+    best_val = func.reset(best_sol) if delta else func(best_sol)
     val,sol = best_val,best_sol
     i = 1
-    while again(i, best_val, best_sol):
+    nb_evals = 1
+    while again(i, best_val, best_sol, nb_evals):
         sol = neighb(best_sol)
-        val = func(sol)
+        val = func.move(sol) if delta else func(sol)
+        nb_evals += 1
         # Use >= and not >, so as to avoid random walk on plateus.
         if val >= best_val:
             best_val = val
             best_sol = sol
+            if delta:
+                func.commit()
+        elif delta:
+            func.revert()
         i += 1
     return best_val, best_sol
 
-def annealing(func, init, neighb, again, temperature0, Lambda) :
-    best_sol = init()
-    temperature = temperature0
-    best_val = func(best_sol)
+def annealing(func, init, neighb, again, temperature0, Lambda, snapshot=None, state=None, rng=None) :
+    # If snapshot is given, it is called with the state of the run at the end of each iteration (see iters.snapshot),
+    # and if state is given, the run continues from this state instead of starting from init.
+    # Acceptance tests draw from a pool of random numbers, which is part of the state.
+    delta = hasattr(func, "move")
+    draw = uniforms(make.generator(rng))
+    if state is None :
+    	best_sol = init()
+    	temperature = temperature0
+    	best_val = func.reset(best_sol) if delta else func(best_sol)
+    	i = 1
+    	nb_evals = 1
+    else :
+    	best_sol, best_val, temperature = state["best_sol"], state["best_val"], state["temperature"]
+    	i, nb_evals = state["i"], state["nb_evals"]
+    	draw.block, draw.k = state["uniforms"]
+    	if delta :
+    		func.reset(best_sol)
     val, sol = best_val, best_sol
-    i = 1
-    while again(i, best_val, best_sol) :
+    while again(i, best_val, best_sol, nb_evals) :
     	sol = neighb(best_sol)
-    	val = func(sol)
-    	if val >= best_val and np.exp((best_val-val)/temperature) > np.random.random() :
+    	val = func.move(sol) if delta else func(sol)
+    	nb_evals += 1
+    	if val >= best_val and np.exp((best_val-val)/temperature) > draw() :
     		best_sol = sol
     		best_val = val
+    		if delta :
+    			func.commit()
+    	elif delta :
+    		func.revert()
     	temperature = Lambda*temperature
     	i += 1
+    	if snapshot is not None :
+    		snapshot(i, dict(best_sol=best_sol, best_val=best_val, temperature=temperature, i=i, nb_evals=nb_evals, uniforms=(draw.block, draw.k)))
+    return best_val, best_sol
+
+def tempering(func, init, neighb, again, temperature0, Lambda, n_replicas, ratio=2, period=10, batch_func=None, rng=None) :
+    """Parallel tempering (replica exchange) annealing template.
+
+    Run n_replicas chains at once, as a single stacked array of solutions,
+    at the temperatures temperature0 / ratio**k, all cooled by Lambda
+    at each iteration. neighb must move all the chains at once
+    (as num.neighb_square and bit.neighb_square do), and batch_func,
+    if given, evaluate them in a single call.
+    Each chain accepts worse neighbors following the Metropolis rule,
+    and every period iterations, adjacent chains exchange their temperatures
+    (that is, their solutions) following the replica exchange rule."""
+    assert(n_replicas > 0)
+    rng = make.generator(rng)
+    temperatures = temperature0 / ratio ** np.arange(n_replicas)
+    evaluate = batch_func if batch_func is not None else lambda sols: np.array([func(s) for s in sols])
+    sols = np.array([init() for _ in range(n_replicas)])
+    vals = np.asarray(evaluate(sols), dtype=float)
+    best = np.argmax(vals)
+    best_val, best_sol = vals[best], np.copy(sols[best])
+    nb_evals = n_replicas
+    i = 1
+    while again(i, best_val, best_sol, nb_evals) :
+    	new = neighb(sols)
+    	new_vals = np.asarray(evaluate(new), dtype=float)
+    	nb_evals += n_replicas
+
+    	# Metropolis acceptance of all the chains (maximization).
+    	accept = rng.random(n_replicas) < np.exp(np.minimum(new_vals - vals, 0) / temperatures)
+    	sols[accept] = new[accept]
+    	vals[accept] = new_vals[accept]
+    	best = np.argmax(vals)
+    	if vals[best] > best_val :
+    		best_val, best_sol = vals[best], np.copy(sols[best])
+
+    	# Exchange the solutions of adjacent chains, alternating even and odd pairs.
+    	if i % period == 0 and n_replicas > 1 :
+    		low = np.arange((i // period) % 2, n_replicas-1, 2)
+    		high = low + 1
+    		swap = (1/temperatures[low] - 1/temperatures[high]) * (vals[high] - vals[low])
+    		swap = rng.random(len(low)) < np.exp(np.minimum(swap, 0))
+    		low, high = low[swap], high[swap]
+    		sols[low], sols[high] = sols[high], sols[low]
+    		vals[low], vals[high] = vals[high], vals[low]
+
+    	temperatures = Lambda*temperatures
+    	i += 1
     return best_val, best_sol
 
+def rank(sol, func, batch_func=None):
+    """Sort a population by decreasing values.
+    Return the sorted population, its values, which are computed
+    in a single call if batch_func is given, and are None otherwise,
+    and the number of evaluations."""
+    if batch_func is None:
+        return sorted(sol,key=func,reverse=True), None, len(sol)
+    vals = batch_func(sol)
+    # Stable, as sorted, so that ties keep the same order.
+    order = np.argsort(-vals, kind="stable")
+    return [sol[k] for k in order], vals[order], len(sol)
+
 # Genetic algorithm with sample of the n_ech best elements of the population
 
-def simple_evolution(func, init, neighb, again, n_pop, n_ech, p_mut, p_cross, simple_crossover, nb_sensors) :
+def simple_evolution(func, init, neighb, again, n_pop, n_ech, p_mut, p_cross, simple_crossover, nb_sensors, batch_func=None, rng=None) :
+    rng = make.generator(rng)
+    # Crossovers draw from a pool of random numbers.
+    draw = uniforms(rng)
     sol = []
     for _ in range(n_pop) :
     	sol.append(init())
-    sol = sorted(sol,key=func,reverse=True)
+    sol,vals,nb_evals = rank(sol,func,batch_func)
     best_sol = sol[0]
-    best_val = func(best_sol)
+    best_val = func(best_sol) if vals is None else vals[0]
+    nb_evals += 1 if vals is None else 0
     i = 1
-    while again(i, best_val, best_sol):
+    while again(i, best_val, best_sol, nb_evals):
+    	mutation = rng.random(n_ech) < p_mut
+    	cross = rng.random(n_ech) < p_cross
     	for j in range(n_ech) :
-    		if np.random.random() < p_mut :
+    		if mutation[j] :
     			sol.append(neighb(sol[j]))
-    		elif np.random.random() < p_cross:
-    			sol.append(simple_crossover(sol[:n_ech],neighb,j,p_mut,nb_sensors))	
-    	sol = sorted(sol,key=func,reverse=True)
+    		elif cross[j]:
+    			sol.append(simple_crossover(sol[:n_ech],neighb,j,p_mut,nb_sensors,rng=rng,uniform=draw))	
+    	sol,vals,n = rank(sol,func,batch_func)
     	sol = sol[:n_pop-n_ech]
     	best_sol = sol[0]
-    	best_val = func(best_sol)
+    	best_val = func(best_sol) if vals is None else vals[0]
+    	nb_evals += n + (1 if vals is None else 0)
     	i += 1
     return best_val, best_sol
 
 
 # Genetic algorithm with random sample of the population
 
-def evolution(func, init, neighb, again, n_pop, n_ech, p_mut, p_cross, crossover, nb_sensors) :
+class population:
+    """Solutions of a population and their values (the fitness column).
+
+    Solutions are the rows of a matrix if they all have the same shape,
+    so that they are copied and evaluated at once, or the items
+    of a list otherwise (like the solutions of the sparse encoding)."""
+
+    def __init__(self, sols, size):
+        """Store the given solutions, with room for size solutions.
+        Their values are to be computed with evaluate."""
+        shapes = set(np.shape(s) for s in sols)
+        if len(shapes) == 1 :
+            self.sols = np.empty((size,)+shapes.pop(), dtype=np.asarray(sols[0]).dtype)
+            self.sols[:len(sols)] = sols
+        else :
+            self.sols = list(sols) + [None] * (size-len(sols))
+        self.vals = np.full(size, -np.inf)
+
+    def __setitem__(self, k, sol):
+        if isinstance(self.sols, np.ndarray) and np.shape(sol) != self.sols.shape[1:] :
+            self.sols = list(self.sols)
+        self.sols[k] = sol
+
+    def evaluate(self, keys, func, batch_func=None):
+        """Compute the values of the solutions at the given indices,
+        in a single call if batch_func is given.
+        Return the number of evaluations."""
+        if len(keys) > 0 :
+            if batch_func is None :
+                self.vals[keys] = [func(self.sols[k]) for k in keys]
+            elif isinstance(self.sols, np.ndarray) :
+                self.vals[keys] = batch_func(self.sols[keys])
+            else :
+                self.vals[keys] = batch_func([self.sols[k] for k in keys])
+        return len(keys)
+
+    def replace(self, targets, sources):
+        """Copy the solutions and values at the sources indices to the targets ones."""
+        if isinstance(self.sols, np.ndarray) :
+            self.sols[targets] = self.sols[sources]
+        else :
+            for t,s in zip(targets, sources) :
+                self.sols[t] = self.sols[s]
+        self.vals[targets] = self.vals[sources]
+
+    def best(self, n):
+        """Index of the best solution among the n first ones."""
+        return np.argmax(self.vals[:n])
+
+
+def evolution(func, init, neighb, again, n_pop, n_ech, p_mut, p_cross, crossover, nb_sensors, batch_func=None, screen=None, migrate=None, snapshot=None, state=None, rng=None) :
     
-    # We initialize a vector of the population of size n_pop and decreasing order on the values, so the best candidate is at first position.
-    sol = []
-    for _ in range(n_pop) :
-    	sol.append(init())
-    sol = sorted(sol,key=func,reverse=True)
-    best_sol = sol[0]
-    best_val = func(best_sol)
-    i = 1
+    # We initialize a population of size n_pop, with room for a sample of size n_ech after it, and keep the values of its solutions.
+    # If batch_func is given, solutions are evaluated all at once.
+    # If screen is given (see make.screen), the new solutions of the sample are evaluated through it, and those it rejects are eliminated.
+    # If migrate is given, it is called with the population and its values at the end of each generation, and returns solutions replacing the worst ones.
+    # If snapshot is given, it is called with the state of the run at the end of each generation (see iters.snapshot),
+    # and if state is given, the run continues from this state instead of a new population.
+    # Crossovers draw from a pool of random numbers, which is part of the state.
+    rng = make.generator(rng)
+    draw = uniforms(rng)
+    if state is None :
+    	pop = population([init() for _ in range(n_pop)], n_pop+n_ech)
+    	nb_evals = pop.evaluate(np.arange(n_pop), func, batch_func)
+    	best = pop.best(n_pop)
+    	best_sol, best_val = np.array(pop.sols[best]), pop.vals[best]
+    	i = 1
+    else :
+    	pop, best_sol, best_val = state["population"], state["best_sol"], state["best_val"]
+    	i, nb_evals = state["i"], state["nb_evals"]
+    	draw.block, draw.k = state["uniforms"]
+    sample = np.arange(n_pop, n_pop+n_ech)
     
     # We use a sample of size n_ech
-    while again(i, best_val, best_sol):
+    while again(i, best_val, best_sol, nb_evals):
     	
-    	# We randomly choose two solutions in the population and we keep the best in the sample. We append it at the end of the vector.
+    	# We randomly choose two solutions in the population and we keep the best in the sample, at the end of the population.
+    	# All the tournaments of the generation are drawn at once,
+    	# the second solution of a tournament being drawn among the n_pop-1 others.
+    	ech1 = rng.integers(0,n_pop,n_ech)
+    	ech2 = (ech1 + rng.integers(1,n_pop,n_ech)) % n_pop
+    	pop.replace(sample, np.where(pop.vals[ech2] > pop.vals[ech1], ech2, ech1))
+
+    	# We apply the mutation operator (function neighb) with a probability p_mut and the crossover operation with a probability p_cross to all elements of the sample.
+    	mutation = rng.random(n_ech) < p_mut
+    	cross = rng.random(n_ech) < p_cross
     	for j in range(n_ech) :
-    		ech1 = np.random.randint(0,n_pop)
-    		ech2 = np.random.randint(0,n_pop)
-    		while ech1 == ech2 :
-    			ech2 = np.random.randint(0,n_pop)
-    		if func(sol[ech2]) > func(sol[ech1]) :
-    			sol.append(sol[ech2])
-    		else :
-    			sol.append(sol[ech1])
-    		
-    		# We apply the mutation operator (function neighb) with a probability p_mut and the crossover operation with a probability p_cross to all elements of the sample.
-	    	if np.random.random() < p_mut :
-	    		sol[n_pop+j] = neighb(sol[n_pop+j])
+	    	if mutation[j] :
+	    		pop[n_pop+j] = neighb(pop.sols[n_pop+j])
 	    	
-	    	elif np.random.random() < p_cross:
-	    		sol[n_pop+j] = crossover(sol,j,n_pop,neighb,p_mut,nb_sensors)
+	    	elif cross[j]:
+	    		pop[n_pop+j] = crossover(pop.sols,j,n_pop,neighb,p_mut,nb_sensors,rng=rng,uniform=draw)
+
+    	# Only the new solutions are evaluated, the others keep the values of their parents.
+    	if screen is None :
+    		nb_evals += pop.evaluate(sample[mutation | cross], func, batch_func)
+    	else :
+    		if pop.evaluate(sample[mutation | cross], func, screen) > 0 :
+    			nb_evals += screen.last
     	
-    	# Finally, we compute the new population by eliminating the n_ech worst values.
-    	sol = sorted(sol,key=func,reverse=True)
-    	sol = sol[:n_pop]
-    	best_sol = sol[0]
-    	best_val = func(best_sol)
+    	# Finally, we compute the new population by eliminating the n_ech worst values,
+    	# moving the surviving solutions of the sample in place of the eliminated ones.
+    	survivors = np.argpartition(-pop.vals, n_pop-1)[:n_pop]
+    	eliminated = np.setdiff1d(np.arange(n_pop), survivors)
+    	pop.replace(eliminated, survivors[survivors >= n_pop])
+    	if migrate is not None :
+    		migrants = migrate(i, pop.sols[:n_pop], pop.vals[:n_pop], nb_evals)
+    		if len(migrants) > 0 :
+    			worst = np.argpartition(pop.vals[:n_pop], len(migrants)-1)[:len(migrants)]
+    			for k,migrant in zip(worst, migrants) :
+    				pop[k] = migrant
+    			nb_evals += pop.evaluate(worst, func, batch_func)
+    	best = pop.best(n_pop)
+    	if pop.vals[best] != best_val :
+    		best_sol, best_val = np.array(pop.sols[best]), pop.vals[best]
     	i += 1
+    	if snapshot is not None :
+    		snapshot(i, dict(population=pop, best_sol=best_sol, best_val=best_val, i=i, nb_evals=nb_evals, uniforms=(draw.block, draw.k)))
     return best_val, best_sol
 
 # We compute the genetic algorithm with random sampling and using a dictionary, so we keep in memory the selected samples. We ensure to select only different elements at one iteration.
 
-def dict_evolution(func, init, neighb, again, n_pop, n_ech, p_mut, p_cross, crossover, nb_sensors) :
+class ranked_keys:
+    """Read-only sequence of the keys of a ranking, by increasing values."""
+
+    def __init__(self, order):
+        self.order = order
+
+    def __getitem__(self, k):
+        return self.order[k][1]
+
+    def __len__(self):
+        return len(self.order)
+
+
+class ranking(dict):
+    """Dictionary of (solution, value) pairs, along with the order of its keys
+    by increasing values (ties being ordered by keys).
+
+    The order is a sorted list of (value, key) pairs, updated in place
+    by bisection when sort is called with the keys whose values changed,
+    so that the best pair and the key of rank k are read in constant time."""
+
+    def __init__(self):
+        super().__init__()
+        self.order = []
+        self.ranked = ranked_keys(self.order)
+        # Values of the keys, as they are in the order.
+        self.sorted_vals = {}
+
+    def sort(self, keys):
+        """Update the order of the given keys."""
+        for key in keys :
+            if key in self.sorted_vals :
+                del self.order[bisect.bisect_left(self.order, (self.sorted_vals[key], key))]
+            val = self[key][1]
+            bisect.insort(self.order, (val, key))
+            self.sorted_vals[key] = val
+
+    def best(self):
+        """The (solution, value) pair of the best value."""
+        return self[self.order[-1][1]]
+
+
+def dict_evolution(func, init, neighb, again, n_pop, n_ech, p_mut, p_cross, crossover, nb_sensors, batch_func=None, screen=None, rng=None) :
     
-    # We initialize a vector of the population of size n_pop and decreasing order on the values, so the best candidate is at first position.
-    dict_sol = dict()
+    # We initialize a dictionary of the population of size n_pop, ranked by increasing values, so the best candidate is at last rank.
+    # If batch_func is given, new solutions are evaluated all at once, at the end of each generation.
+    # If screen is given (see make.screen), they are evaluated through it instead, and those it rejects give their place back to their parents.
+    # Tournaments and crossovers draw from a pool of random numbers.
+    rng = make.generator(rng)
+    draw = uniforms(rng)
+    later = batch_func if screen is None else screen
+    dict_sol = ranking()
     i = 0
     for _ in range(n_pop) :
     	i+=1
     	sol = init()
-    	val = func(sol)
+    	val = func(sol) if batch_func is None else None
     	dict_sol[i] = (sol,val)
-    sorted_dict_sol = {k: v for k, v in sorted(dict_sol.items(), key=lambda item: item[1][1])}
-    best_val = list(sorted_dict_sol.values())[-1][1]
-    best_sol = list(sorted_dict_sol.values())[-1][0]
+    if batch_func is not None :
+    	evaluate(dict_sol, dict_sol.keys(), batch_func)
+    dict_sol.sort(dict_sol.keys())
+    best_sol, best_val = dict_sol.best()
     i = 1
-    count_appel_fonction_obj = n_pop
+    nb_evals = n_pop
 
     # We use a sample of size n_ech
-    while again(i, best_val, best_sol):
-    	
-    	liste_indice_tire = []
-    	sorted_list_keys = list(sorted_dict_sol.keys())
+    while again(i, best_val, best_sol, nb_evals):
     	
+    	# Ranks stay those of the beginning of the generation, until the order is updated.
+    	indices_tires = set()
+    	changed_keys = []
+    	parents = {}
+    	mutation = rng.random(n_ech) < p_mut
+    	cross = rng.random(n_ech) < p_cross
     	
     	# We randomly choose two elements in the population and we keep the best one in the sample.
     	for j in range(n_ech) :
     	
-    		n_ech1 = np.random.randint(0,n_pop)
-    		while n_ech1 in liste_indice_tire :
-    			n_ech1 = np.random.randint(0,n_pop)
-    		n_ech2 = np.random.randint(0,n_pop)
-    		while n_ech1 == n_ech2 or n_ech2 in liste_indice_tire :
-    			n_ech2 = np.random.randint(0,n_pop)
+    		n_ech1 = int(draw()*n_pop)
+    		while n_ech1 in indices_tires :
+    			n_ech1 = int(draw()*n_pop)
+    		n_ech2 = int(draw()*n_pop)
+    		while n_ech1 == n_ech2 or n_ech2 in indices_tires :
+    			n_ech2 = int(draw()*n_pop)
     		
-    		if n_ech1 > n_ech2 :
-    			key_ech = sorted_list_keys[n_ech1]
-    			liste_indice_tire.append(n_ech1)
-    		else :
-    			key_ech = sorted_list_keys[n_ech2]
-    			liste_indice_tire.append(n_ech2)
+    		# The best one has the highest rank.
+    		rank_ech = max(n_ech1, n_ech2)
+    		key_ech = dict_sol.ranked[rank_ech]
+    		indices_tires.add(rank_ech)
 
     		ech = dict_sol[key_ech][0]
 
     		# We apply the mutation operator (function neighb) with a probability p_mut and the crossover operation with a probability p_cross to all elements of the sample.
-	    	if np.random.random() < p_mut :
+	    	if mutation[j] :
 	    		sol = neighb(ech)
-	    		val = func(sol)
+	    		val = func(sol) if later is None else None
+	    		parents[key_ech] = dict_sol[key_ech]
 	    		dict_sol[key_ech] = (sol,val)
-	    		count_appel_fonction_obj += 1
+	    		changed_keys.append(key_ech)
+	    		nb_evals += 1
 	    	
-	    	elif np.random.random() < p_cross:
-	    		sol = crossover(dict_sol,sorted_list_keys,ech,key_ech,n_pop,neighb,p_mut,nb_sensors)
-	    		val = func(sol)
+	    	elif cross[j]:
+	    		sol = crossover(dict_sol,dict_sol.ranked,ech,key_ech,n_pop,neighb,p_mut,nb_sensors,rng=rng,uniform=draw)
+	    		val = func(sol) if later is None else None
+	    		parents[key_ech] = dict_sol[key_ech]
 	    		dict_sol[key_ech] = (sol,val)
-	    		count_appel_fonction_obj += 1
+	    		changed_keys.append(key_ech)
+	    		nb_evals += 1
 
-    	# Finally, we implement the new population
-    	sorted_dict_sol = {k: v for k, v in sorted(dict_sol.items(), key=lambda item: item[1][1])}
-    	best_val = list(sorted_dict_sol.values())[-1][1]
-    	best_sol = list(sorted_dict_sol.values())[-1][0]
+    	# Finally, we implement the new population, ranking only the changed solutions.
+    	if later is not None :
+    		evaluate(dict_sol, changed_keys, later)
+    	if screen is not None and len(changed_keys) > 0 :
+    		nb_evals += screen.last - len(changed_keys)
+    		for key in changed_keys :
+    			if dict_sol[key][1] == -np.inf :
+    				dict_sol[key] = parents[key]
+    	dict_sol.sort(changed_keys)
+    	best_sol, best_val = dict_sol.best()
     	i += 1
     return best_val, best_sol
+
+
+def evaluate(dict_sol, keys, batch_func):
+    """Set the values of the solutions of dict_sol at the given keys,
+    with a single call to batch_func."""
+    keys = list(keys)
+    if len(keys) > 0 :
+        vals = batch_func([dict_sol[k][0] for k in keys])
+        for k,val in zip(keys,vals) :
+            dict_sol[k] = (dict_sol[k][0],val)
+
+
+# Island model: several populations evolve in parallel processes, and regularly send their best solutions to other islands.
+
+class port:
+    """Connection of an island to the main process.
+    Used as both the stopping criterion and the migrate operator of evolution:
+    every period generations, send the number of evaluations and the n_migrants best solutions
+    (the best first), then receive whether to continue and the incoming migrants.
+    As soon as the best value of an island reaches target, the shared event done is set,
+    and every island stops at its next generation, sending its best solution without waiting."""
+
+    def __init__(self, conn, period, n_migrants, done, target):
+        self.conn = conn
+        self.period = period
+        self.n_migrants = n_migrants
+        self.done = done
+        self.target = target
+        self.going = True
+
+    def __call__(self, i, val, sol, evals):
+        if not self.going :
+            return False
+        if val >= self.target :
+            self.done.set()
+        if self.done.is_set() :
+            self.conn.send((i, evals, [np.array(sol)], True))
+            self.going = False
+        return self.going
+
+    def migrate(self, i, sols, vals, evals):
+        if i % self.period != 0 :
+            return []
+        best = np.argsort(-vals, kind="stable")[:self.n_migrants]
+        self.conn.send((i, evals, [np.array(sols[k]) for k in best], False))
+        self.going, migrants = self.conn.recv()
+        return migrants if self.going else []
+
+
+def island(conn, rng, stream, func, init, neighb, period, n_migrants, done, target, kwargs):
+    """Run the evolution template in a worker process, through a port.
+    The generator rng (the copy, in this process, of the one captured by the operators)
+    continues with the independent stream of the island."""
+    rng.bit_generator.state = stream.bit_generator.state
+    gate = port(conn, period, n_migrants, done, target)
+    evolution(func, init, neighb, gate, migrate=gate.migrate, rng=rng, **kwargs)
+    conn.close()
+
+
+def island_evolution(func, init, neighb, again, n_islands, period, n_migrants, topology, target=np.inf, rng=None, **kwargs) :
+    """Island model of the evolution template: run n_islands populations
+    in parallel processes. Every period generations, each island sends its
+    n_migrants best solutions to the next one (topology "ring")
+    or to a random other one (topology "random").
+    The stopping criterion again is called by the main process
+    with the best solution of all islands and the evaluations of all islands,
+    every period generations.
+    All islands also stop at their next generation as soon as one of them reaches target,
+    without waiting for the migration (so that the generation at which they stop depends
+    on the scheduling of the processes).
+    Each island draws from a child stream of rng,
+    which should be the generator captured by the operators.
+    Other arguments are those of evolution."""
+    assert(topology in ("ring","random"))
+    rng = make.generator(rng)
+    # Operators are closures, which are inherited by forked processes but cannot be pickled.
+    ctx = multiprocessing.get_context("fork")
+    streams = rng.spawn(n_islands)
+    done = ctx.Event()
+    conns = []
+    procs = []
+    for k in range(n_islands) :
+    	conn, child = ctx.Pipe()
+    	proc = ctx.Process(target=island, args=(child, rng, streams[k], func, init, neighb, period, n_migrants, done, target, kwargs), daemon=True)
+    	proc.start()
+    	child.close()
+    	conns.append(conn)
+    	procs.append(proc)
+
+    best_val, best_sol = None, None
+    # Evaluations made by the main process, then by each island.
+    nb_evals = 0
+    island_evals = [0] * n_islands
+    # Islands which stopped on their own, once one of them reached the target.
+    stopped = [False] * n_islands
+    going = True
+    while going :
+    	emigrants = [[] for _ in range(n_islands)]
+    	for k,conn in enumerate(conns) :
+    		if stopped[k] :
+    			continue
+    		i, island_evals[k], emigrants[k], stopped[k] = conn.recv()
+    		val = func(emigrants[k][0])
+    		nb_evals += 1
+    		if best_val is None or val > best_val :
+    			best_val, best_sol = val, emigrants[k][0]
+    	going = again(i, best_val, best_sol, nb_evals + sum(island_evals)) and not any(stopped)
+
+    	# Migrants of island k go to island dest[k].
+    	if topology == "ring" :
+    		dest = [(k+1) % n_islands for k in range(n_islands)]
+    	else :
+    		dest = [(k + rng.integers(1,n_islands)) % n_islands if n_islands > 1 else k for k in range(n_islands)]
+    	immigrants = [[] for _ in range(n_islands)]
+    	for k in range(n_islands) :
+    		immigrants[dest[k]] += list(emigrants[k])
+    	for k in range(n_islands) :
+    		if not stopped[k] :
+    			conns[k].send((going, immigrants[k]))
+
+    for proc in procs :
+    	proc.join()
+    return best_val, best_sol
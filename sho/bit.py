@@ -1,27 +1,130 @@
 import math
+import functools
 import numpy as np
 import copy
 
-from . import x,y,pb
+from . import x,y,pb,make
 
 ########################################################################
 # Objective functions
 ########################################################################
 
-def cover_sum(sol, domain_width, sensor_range, dim):
-    """Compute the coverage quality of the given array of bits."""
+# Number of ones of each byte.
+popcount = np.array([bin(b).count("1") for b in range(256)], dtype=np.uint8)
+
+
+class bitsets:
+    """Coverage disks of all the cells of a domain, as packed bitsets.
+
+    As sensors only sit on cells, the disk covered from any cell is
+    the same `pb.disk`, shifted: only its 8 bit-shifted packed copies
+    are stored (phases), and the disk of a cell is the copy of its phase
+    at its byte offset. The domain is padded by the disk's half-width
+    on every side, the left padding being a whole number of bytes,
+    so that disks are ORed without clipping, and the cells out of
+    the domain are masked out before counting.
+    """
+
+    def __init__(self, domain_width, sensor_range):
+        self.domain_width = domain_width
+        stamp = pb.disk(sensor_range)
+        self.k = k = (len(stamp)-1) // 2
+        # Bytes of a packed row of the disk, for all phases.
+        nbytes = (2*k+1 + 7) // 8 + 1
+        phases = np.zeros((8, 2*k+1, 8*nbytes), dtype=bool)
+        for p in range(8):
+            phases[p, :, p:p+2*k+1] = stamp
+        self.phases = np.packbits(phases, axis=-1)
+        self.pad = 8 * ((k+7) // 8)
+        self.width = (domain_width-1 + self.pad-k) // 8 + nbytes
+        mask = np.zeros(8*self.width, dtype=bool)
+        mask[self.pad:self.pad+domain_width] = True
+        self.mask = np.packbits(mask)
+
+    def count(self, xs, ys):
+        """Number of cells covered by sensors on the given columns and rows."""
+        k, nbytes = self.k, self.phases.shape[-1]
+        cov = np.zeros((self.domain_width + 2*k, self.width), dtype=np.uint8)
+        # First column of the disk of each sensor, in the padded domain.
+        for x0,y in zip((np.asarray(xs) + self.pad-k).tolist(), np.asarray(ys).tolist()):
+            b = x0 >> 3
+            cov[y:y+2*k+1, b:b+nbytes] |= self.phases[x0 & 7]
+        return int(np.sum(popcount[cov[k:k+self.domain_width] & self.mask]))
+
+
+@functools.lru_cache(maxsize=None)
+def disks(domain_width, sensor_range):
+    """The `bitsets` of the given domain, cached per (domain_width, sensor_range)
+    for all the evaluations of the runs of the current process."""
+    return bitsets(domain_width, sensor_range)
+
+
+def cover_sum(sol, domain_width, sensor_range, dim, visibility=None):
+    """Compute the coverage quality of the given array of bits,
+    as the union of the precomputed `disks` of its ones."""
     assert(0 < sensor_range <= math.sqrt(2))
     assert(0 < domain_width)
     assert(dim > 0)
     assert(len(sol) >= dim)
+    if visibility is None:
+        ys,xs = np.nonzero(np.asarray(sol) == 1)
+        s = float(disks(domain_width, sensor_range*domain_width).count(xs, ys))
+        assert(s >= len(xs))
+        return s
     domain = np.zeros((domain_width,domain_width))
     sensors = to_sensors(sol)
-    cov = pb.coverage(domain, sensors, sensor_range*domain_width)
+    cov = pb.coverage(domain, sensors, sensor_range*domain_width, visibility)
     s = np.sum(cov)
-    assert(s >= len(sensors))
+    # Sensors on obstacles cover nothing.
+    assert(visibility is not None or s >= len(sensors))
     return s
 
 
+def cover_sum_batch(sols, domain_width, sensor_range, dim, visibility=None):
+    """Compute the coverage quality of every array of bits of a population,
+    given as a sequence of arrays or a (P, domain_width, domain_width) array."""
+    assert(0 < sensor_range <= math.sqrt(2))
+    assert(0 < domain_width)
+    assert(dim > 0)
+    sols = np.asarray(sols)
+    p, ys, xs = np.nonzero(sols == 1)
+    # Rank of each sensor within its solution.
+    nb = np.bincount(p, minlength=len(sols))
+    first = np.cumsum(nb) - nb
+    if visibility is None:
+        index = disks(domain_width, sensor_range*domain_width)
+        return np.array([index.count(xs[i:i+n], ys[i:i+n]) for i,n in zip(first.tolist(), nb.tolist())], dtype=float)
+    sensors = np.zeros((len(sols), max(1,np.max(nb)), 2), dtype=int)
+    sensors[p, np.arange(len(p)) - first[p]] = np.stack((xs,ys), axis=-1)
+    return pb.coverage_sum(sensors, domain_width, sensor_range*domain_width, nb, visibility)
+
+
+def cover_sum_coarse(sols, domain_width, sensor_range, dim, factor):
+    """Approximate the coverage quality of every array of bits of a population,
+    on the domain downsampled by factor (see pb.coverage_coarse)."""
+    assert(0 < sensor_range <= math.sqrt(2))
+    assert(0 < domain_width)
+    assert(dim > 0)
+    sols = np.asarray(sols)
+    p, ys, xs = np.nonzero(sols == 1)
+    nb = np.bincount(p, minlength=len(sols))
+    first = np.cumsum(nb) - nb
+    sensors = np.zeros((len(sols), max(1,np.max(nb)), 2), dtype=int)
+    sensors[p, np.arange(len(p)) - first[p]] = np.stack((xs,ys), axis=-1)
+    return pb.coverage_coarse(sensors, domain_width, sensor_range*domain_width, factor, nb)
+
+
+class cover_delta(pb.coverage_counts):
+    """Stateful cover_sum, where only the disks of the ones
+    that moved are updated when evaluating a neighbor."""
+
+    def __init__(self, domain_width, sensor_range, dim):
+        assert(0 < sensor_range <= math.sqrt(2))
+        assert(0 < domain_width)
+        assert(dim > 0)
+        super().__init__(to_sensors, domain_width, sensor_range*domain_width)
+
+
 def to_sensors(sol):
     """Convert an square array of d lines/columns containing n ones
     to an array of n 2-tuples with related coordinates.
@@ -30,22 +133,19 @@ def to_sensors(sol):
     [(0, 0), (0, 1)]
     """
     assert(len(sol)>0)
-    sensors = []
-    for i in range(len(sol)):
-        for j in range(len(sol[i])):
-            if sol[i][j] == 1:
-                sensors.append( (j,i) )
-    return sensors
+    ys,xs = np.nonzero(np.asarray(sol) == 1)
+    return list(zip(xs.tolist(), ys.tolist()))
 
 
 ########################################################################
 # Initialization
 ########################################################################
 
-def rand(domain_width, nb_sensors):
+def rand(domain_width, nb_sensors, rng=None):
     """"Draw a random domain containing nb_sensors ones."""
+    rng = make.generator(rng)
     domain = np.zeros( (domain_width,domain_width) )
-    for x,y in np.random.randint(0, domain_width, (nb_sensors, 2)):
+    for x,y in rng.integers(0, domain_width, (nb_sensors, 2)):
         domain[y][x] = 1
     return domain
 
@@ -54,79 +154,86 @@ def rand(domain_width, nb_sensors):
 # Neighborhood
 ########################################################################
 
-def neighb_square(sol, scale, domain_width):
-    """Draw a random array by moving every ones to adjacent cells."""
+def neighb_square(sol, scale, domain_width, rng=None):
+    """Draw a random array by moving every ones to adjacent cells.
+
+    Work on a single array or on a (P, domain_width, domain_width)
+    population of arrays. Every ones are moved at once: a move is
+    cancelled if its cell was already occupied in sol, or if it is
+    the target of a previous one (in the order of the rows)."""
+    rng = make.generator(rng)
     assert(0 < scale <= 1)
+    sol = np.asarray(sol)
     # Copy, because Python pass by reference
     # and we may not want to alter the original solution.
-    new = copy.copy(sol)
-    for py in range(len(sol)):
-        for px in range(len(sol[py])):
-            # Indices order is (y,x) in order to match
-            # coordinates of images (row,col).
-            if sol[py][px] == 1:
-                # Add a one somewhere around.
-                w = scale/2 * domain_width
-                ny = np.random.randint(py-w,py+w)
-                nx = np.random.randint(px-w,px+w)
-                ny = min(max(0,ny),domain_width-1)
-                nx = min(max(0,nx),domain_width-1)
-
-                if new[ny][nx] != 1:
-                    new[py][px] = 0 # Remove original position.
-                    new[ny][nx] = 1
-                # else pass
+    new = np.array(sol)
+    # Indices order is (y,x) in order to match
+    # coordinates of images (row,col),
+    # preceded by the index of the solution in a population.
+    ones = np.nonzero(sol == 1)
+    pos = np.stack(ones[-2:], axis=-1)
+    # Add a one somewhere around, with bounds truncated as randint does.
+    w = scale/2 * domain_width
+    moved = rng.integers((pos-w).astype(int), (pos+w).astype(int))
+    moved = np.clip(moved, 0, domain_width-1)
+    targets = ones[:-2] + (moved[:,0], moved[:,1])
+
+    free = sol[targets] != 1
+    first = np.zeros(len(pos), dtype=bool)
+    first[np.unique(np.ravel_multi_index(targets, sol.shape), return_index=True)[1]] = True
+    accept = free & first
+
+    new[tuple(i[accept] for i in ones)] = 0 # Remove original positions.
+    new[tuple(i[accept] for i in targets)] = 1
     return new
 
+
+def second(sol):
+    """Return the (row,col) indices of the second one of the given array,
+    in the order of the rows, or None if there is less than two ones."""
+    ones = np.flatnonzero(np.asarray(sol) == 1)
+    if len(ones) < 2:
+        return None
+    return np.unravel_index(ones[1], np.shape(sol))
+
 ########################################################################
 # Crossover
 ########################################################################
 
-def simple_crossover(sol,neighb,j,p_mut,nb_sensors) :
+def simple_crossover(sol,neighb,j,p_mut,nb_sensors,rng=None,uniform=None) :
+   rng = make.generator(rng)
+   uniform = rng.random if uniform is None else uniform
+   # uniform may draw from a pool of pre-drawn random numbers (see algo.uniforms).
    
    parent1 = sol[j]
-   n = np.random.randint(0,len(sol))
+   n = int(uniform()*len(sol))
    while n == j :
-       n = np.random.randint(0,len(sol))
+       n = int(uniform()*len(sol))
    parent2 = sol[n]
    
    # We compute the crossover operation by placing the second sensor of parent 2 at the position of second sensor of parent 1.
    # The other sensors of parent 1 are in the child population.
-   c1 = 0
-   child = parent1
-   for l in range(len(parent1)) :
-   	if c1 == 2 :
-   		break
-   	else :
-	   	for m in range(len(parent1[l])) :
-	   		if parent1[l][m] == 1 :
-	   			c1 += 1
-	   		if c1 == 2 :
-	   			child[l][m] = 0
-	   			break
+   child = copy.copy(parent1)
+   lm = second(parent1)
+   if lm is not None :
+   	child[lm] = 0
   
    # The second sensor of parent 2 are in the child population.
-   c2 = 0
-   for l in range(len(parent2)) :
-   	if c2 == 2 :
-   		break
-   	else :
-	   	for m in range(len(parent2[l])) :
-	   		if parent2[l][m] == 1 :
-	   			c2 += 1
-	   		if c2 == 2 :
-	   			child[l][m] = 1
-	   			break
+   lm = second(parent2)
+   if lm is not None :
+   	child[lm] = 1
    
    if not child.sum() == nb_sensors :
    	child = neighb(parent1)	   				
    
    # Finally, we apply the mutation with probability p_mut
-   if np.random.random() < p_mut :
+   if uniform() < p_mut :
    	child = neighb(child)
    return child
 
-def crossover(sol,j,n_pop,neighb,p_mut,nb_sensors) :
+def crossover(sol,j,n_pop,neighb,p_mut,nb_sensors,rng=None,uniform=None) :
+   rng = make.generator(rng)
+   uniform = rng.random if uniform is None else uniform
   
    # We compute the crossover operation by placing the second sensor of parent 2 at the position of second sensor of parent 1.
    # The other sensors of parent 1 are in the child population.
@@ -134,44 +241,28 @@ def crossover(sol,j,n_pop,neighb,p_mut,nb_sensors) :
    # We consider parent 1 as the element of the selected sample.
    parent1 = sol[n_pop+j]
    
-   c1 = 0
-   child = parent1
-   for l in range(len(parent1)) :
-   	if c1 == 2 :
-   		break
-   	else :
-	   	for m in range(len(parent1[l])) :
-	   		if parent1[l][m] == 1 :
-	   			c1 += 1
-	   		if c1 == 2 :
-	   			child[l][m] = 0
-	   			break
+   child = copy.copy(parent1)
+   lm = second(parent1)
+   if lm is not None :
+   	child[lm] = 0
 
    # The second sensor of parent 2 is copied in the child.
    # We select the new parent 2 in the population such as no sensor in the child population is at the position of the second sensor of parent 2
    
    bad_number_sensors = True
    while bad_number_sensors :
-	   n = np.random.randint(0,n_pop)
+	   n = int(uniform()*n_pop)
 	   while n == n_pop+j :
-	   	n = np.random.randint(0,n_pop)
+	   	n = int(uniform()*n_pop)
 	   parent2 = sol[n]
-	   c2 = 0
-	   for l in range(len(parent2)) :
-	   	if c2 == 2 :
-	   		break
-	   	else :
-		   	for m in range(len(parent2[l])) :
-		   		if parent2[l][m] == 1 :
-		   			c2 += 1
-		   		if c2 == 2 :
-		   			child[l][m] = 1
-		   			break	
+	   lm = second(parent2)
+	   if lm is not None :
+	   	child[lm] = 1
 
 	   if child.sum() == nb_sensors :
 	   	bad_number_sensors = False
 
    # Finally, we apply the mutation with probability p_mut
-   if np.random.random() < p_mut :
+   if uniform() < p_mut :
    	child = neighb(child)
    return child
\ No newline at end of file
@@ -1,11 +1,22 @@
+import os
 import sys
+import time
+import pickle
+import threading
+import numpy as np
 from collections import deque
 
+from . import make
+
 ########################################################################
 # Stopping criterions
 ########################################################################
 
-def max(i, val, sol, nb_it):
+# Stopping criterions are called by the algorithm templates
+# with the iteration number, the current best value and solution,
+# and the number of objective function evaluations made so far.
+
+def max(i, val, sol, evals, nb_it):
     """Stop after reaching nb_it iterations."""
     if i < nb_it:
         return True
@@ -13,7 +24,15 @@ def max(i, val, sol, nb_it):
         return False
 
 
-def target(i, val, sol, target):
+def budget(i, val, sol, evals, nb_evals):
+    """Stop after reaching nb_evals objective function evaluations."""
+    if evals < nb_evals:
+        return True
+    else:
+        return False
+
+
+def target(i, val, sol, evals, target):
     """Stop after reaching target value."""
     if val < target:
         return True
@@ -29,7 +48,7 @@ class steady:
         self.delta = delta
         self.delta_vals = deque()
 
-    def __call__(self, i, val, sol):
+    def __call__(self, i, val, sol, evals):
         if i < self.delta: # Always wait the first delta iterations.
             self.delta_vals.append(val)
             return True
@@ -45,31 +64,419 @@ class steady:
                 return True
 
 
+class shared:
+    """Share the best value found by several processes,
+    and stop all of them as soon as it reaches the target value.
+
+    best is a shared multiprocessing.Value (of type 'd')
+    and done a shared multiprocessing.Event."""
+
+    def __init__(self, best, done, target):
+        self.best = best
+        self.done = done
+        self.target = target
+
+    def __call__(self, i, val, sol, evals):
+        with self.best.get_lock():
+            if val > self.best.value:
+                self.best.value = val
+            if self.best.value >= self.target:
+                self.done.set()
+        return not self.done.is_set()
+
+
 # Stopping criterions that are actually just checkpoints.
 
-def several(i, val, sol, agains):
+def several(i, val, sol, evals, agains):
     """several stopping criterions in one."""
     over = []
     for again in agains:
-        over.append( again(i, val, sol) )
+        over.append( again(i, val, sol, evals) )
     return all(over)
 
 
-def save(i, val, sol, filename="run.csv", fmt="{it} ; {val} ; {sol}\n"):
+class pipeline:
+    """Common stopping criterions and checkpoints, fused in a single one.
+
+    Stop after nb_it iterations, when reaching the target value,
+    after nb_evals evaluations, or if the improvement is lesser than epsilon
+    in the last delta iterations (as steady), each test being skipped
+    if its parameter is None. Tests are made in this order, and stop at the first failing one.
+    hooks are checkpoints (like save, history or progress) called before the tests,
+    or (checkpoint, period) pairs for those only called every period iterations.
+    The state saved by snapshots is that of the tests, not of the hooks.
+    """
+
+    def __init__(self, nb_it=None, target=None, nb_evals=None, delta=None, epsilon=0, hooks=()):
+        self.nb_it = np.inf if nb_it is None else nb_it
+        self.target = np.inf if target is None else target
+        self.nb_evals = np.inf if nb_evals is None else nb_evals
+        self.delta = delta
+        self.epsilon = epsilon
+        self.delta_vals = deque()
+        hooks = [h if isinstance(h, tuple) else (h, 1) for h in hooks]
+        self.hooks = [h for h,period in hooks if period == 1]
+        self.periodic = [(h,period) for h,period in hooks if period > 1]
+
+    def __call__(self, i, val, sol, evals):
+        for hook in self.hooks:
+            hook(i, val, sol, evals)
+        for hook,period in self.periodic:
+            if i % period == 0:
+                hook(i, val, sol, evals)
+        if not (i < self.nb_it and val < self.target and evals < self.nb_evals):
+            return False
+        if self.delta is not None:
+            # Same as steady.
+            self.delta_vals.append(val)
+            if i >= self.delta and len(self.delta_vals) > 1:
+                self.delta_vals.popleft()
+                if val - self.delta_vals[0] <= self.epsilon:
+                    return False
+        return True
+
+    def snapshot_state(self):
+        """State of the tests, to be saved by snapshots."""
+        return {"delta_vals": self.delta_vals}
+
+    def restore_state(self, state):
+        self.__dict__.update(state)
+
+
+def save(i, val, sol, evals, filename="run.csv", fmt="{it} ; {val} ; {sol}\n"):
     """Save all iterations to a file."""
     # Append a line at the end of the file.
     with open(filename.format(it=i), 'a') as fd:
-        fd.write( fmt.format(it=i, val=val, sol=sol) )
+        fd.write( fmt.format(it=i, evals=evals, val=val, sol=sol) )
     return True # No incidence on termination.
 
 
-def history(i, val, sol, history):
+class offset:
+    """Stateful operator keeping the size of the file filename in snapshots,
+    and truncating the file back to it when restored,
+    so that the iterations saved after the snapshot are not saved twice when resuming."""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def snapshot_state(self):
+        """Size of the file, to be saved by snapshots."""
+        return {"size": os.path.getsize(self.filename)}
+
+    def restore_state(self, state):
+        os.truncate(self.filename, state["size"])
+
+
+class dump:
+    """Save iterations to a binary file.
+
+    Iterations numbers, evaluations numbers, values and solutions are kept in preallocated
+    buffers of `block` iterations (less if solutions are large),
+    which are appended to the file as .npy arrays when full.
+    Call flush at the end of the run to write the remaining iterations,
+    and read the file with `load`.
+    If improvements is True, only save iterations that improve the value.
+    Solutions may be stored with a more compact dtype.
+    If append is True, add iterations to an existing file (when resuming a run).
+    Snapshots save the size of the file (after flushing it),
+    to which the file is truncated when restored.
+    """
+
+    def __init__(self, filename="run.npy", block=1024, improvements=False, dtype=None, append=False):
+        self.filename = filename
+        self.block = block
+        self.improvements = improvements
+        self.dtype = dtype
+        self.its = None
+        self.evals = None
+        self.vals = None
+        self.sols = None
+        self.n = 0
+        self.best = None
+        # Erase the previous file.
+        if not append:
+            open(filename, 'wb').close()
+
+    def __call__(self, i, val, sol, evals):
+        if self.improvements and self.best is not None and val <= self.best:
+            return True # No incidence on termination.
+        self.best = val
+        if self.sols is None:
+            sol = np.asarray(sol)
+            dtype = sol.dtype if self.dtype is None else self.dtype
+            # Keep buffers in the order of 16 MB at most
+            # (note that max is a stopping criterion, here).
+            size = int(np.clip(2**24 // (sol.size * np.dtype(dtype).itemsize + 1), 1, self.block))
+            self.its = np.empty(size, dtype=int)
+            self.evals = np.empty(size, dtype=int)
+            self.vals = np.empty(size)
+            self.sols = np.empty((size,)+sol.shape, dtype=dtype)
+        self.its[self.n] = i
+        self.evals[self.n] = evals
+        self.vals[self.n] = val
+        self.sols[self.n] = sol
+        self.n += 1
+        if self.n == len(self.its):
+            self.flush()
+        return True
+
+    def flush(self):
+        """Append the buffered iterations to the file."""
+        if self.n > 0:
+            with open(self.filename, 'ab') as fd:
+                np.save(fd, self.its[:self.n])
+                np.save(fd, self.evals[:self.n])
+                np.save(fd, self.vals[:self.n])
+                np.save(fd, self.sols[:self.n])
+            self.n = 0
+
+    def snapshot_state(self):
+        """Size of the file and best value, to be saved by snapshots."""
+        self.flush()
+        return {"size": os.path.getsize(self.filename), "best": self.best}
+
+    def restore_state(self, state):
+        os.truncate(self.filename, state["size"])
+        self.best = state["best"]
+        self.n = 0
+
+
+def load(filename):
+    """Read the iterations saved by `dump`.
+    Return the arrays of iterations numbers, evaluations numbers, values and solutions."""
+    its, evals, vals, sols = [], [], [], []
+    with open(filename, 'rb') as fd:
+        size = os.fstat(fd.fileno()).st_size
+        while fd.tell() < size:
+            its.append(np.load(fd))
+            evals.append(np.load(fd))
+            vals.append(np.load(fd))
+            sols.append(np.load(fd))
+    if len(its) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0), np.empty(0)
+    return np.concatenate(its), np.concatenate(evals), np.concatenate(vals), np.concatenate(sols)
+
+
+class snapshot:
+    """Save the state of a run to a binary file, every period iterations.
+
+    Called by the algorithm templates supporting it with the iteration number
+    and a dictionary of their state. The snapshot also holds the state of
+    the random number generator rng (the shared one if None), and the attributes
+    of the given stateful operators (like an iters.steady instance),
+    or their snapshot_state if they have one (like an iters.pipeline).
+    The file is replaced atomically, so that it always holds a complete snapshot.
+    Read it back with `restore`.
+    """
+
+    def __init__(self, filename, period, stateful=(), rng=None):
+        self.filename = filename
+        self.period = period
+        self.stateful = stateful
+        self.rng = make.generator(rng)
+
+    def __call__(self, i, state):
+        if i % self.period != 0:
+            return
+        data = {
+            "state": state,
+            "random": self.rng.bit_generator.state,
+            "stateful": [op.snapshot_state() if hasattr(op, "snapshot_state") else op.__dict__ for op in self.stateful],
+        }
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'wb') as fd:
+            pickle.dump(data, fd, protocol=pickle.HIGHEST_PROTOCOL)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(tmp, self.filename)
+
+
+def restore(filename, stateful=(), rng=None):
+    """Read a file saved by `snapshot`, restore the state of the random
+    number generator rng and of the stateful operators (in the same order),
+    and return the state to pass to the algorithm template."""
+    with open(filename, 'rb') as fd:
+        data = pickle.load(fd)
+    make.generator(rng).bit_generator.state = data["random"]
+    assert(len(data["stateful"]) == len(stateful))
+    for op,attributes in zip(stateful, data["stateful"]):
+        if hasattr(op, "restore_state"):
+            op.restore_state(attributes)
+        else:
+            op.__dict__.update(attributes)
+    return data["state"]
+
+
+def history(i, val, sol, evals, history):
     history.append((val,sol))
     return True
 
 
-def log(i, val, sol, fmt="{it} {val}\n"):
+class recorder:
+    """Record the iterations of a run in preallocated arrays of size iterations.
+
+    Once the arrays are full, the policy decides which iterations are kept:
+    - "ring": the last size ones,
+    - "stride": one every stride calls, over the whole run,
+      the stride doubling (and every other recorded iteration being dropped)
+      each time the arrays are full,
+    - "improvements": only those improving the value, the last size ones.
+    Solutions are stored in the compact form returned by compact if given
+    (for instance the coordinates of the sensors of the bit encoding),
+    with the given dtype. They are rows of a matrix as long as they have the same shape,
+    and items of a list otherwise.
+    Arrays are read in the order of the iterations with `its`, `evals`,
+    `values` and `solutions`, and history[k] is the (value, solution) pair of the k-th one.
+    """
+
+    def __init__(self, size=1024, policy="stride", compact=None, dtype=None):
+        assert(policy in ("ring", "stride", "improvements"))
+        assert(size > 1)
+        self.size = size
+        self.policy = policy
+        self.compact = compact
+        self.dtype = dtype
+        self.stride = 1
+        self.calls = 0
+        self.best = None
+        # Number of recorded iterations (beyond size for the rotating policies).
+        self.n = 0
+        self.i = np.empty(size, dtype=int)
+        self.e = np.empty(size, dtype=int)
+        self.v = np.empty(size)
+        self.s = None
+
+    def __call__(self, i, val, sol, evals):
+        if self.policy == "improvements":
+            if self.best is not None and val <= self.best:
+                return True # No incidence on termination.
+            self.best = val
+        elif self.policy == "stride":
+            # Calls are counted, as templates may not be called at every iteration number.
+            self.calls += 1
+            if (self.calls-1) % self.stride != 0:
+                return True
+            if self.n == self.size:
+                # Keep every other recorded iteration.
+                kept = slice(0, self.size, 2)
+                m = len(range(*kept.indices(self.size)))
+                self.i[:m], self.e[:m], self.v[:m] = self.i[kept], self.e[kept], self.v[kept]
+                if isinstance(self.s, np.ndarray):
+                    self.s[:m] = self.s[kept]
+                else:
+                    self.s = self.s[kept] + [None] * (self.size-m)
+                self.n = m
+                self.stride *= 2
+                if (self.calls-1) % self.stride != 0:
+                    return True
+        if self.compact is not None:
+            sol = self.compact(sol)
+        sol = np.asarray(sol, dtype=self.dtype)
+        if self.s is None:
+            self.s = np.empty((self.size,)+sol.shape, dtype=sol.dtype)
+        elif isinstance(self.s, np.ndarray) and sol.shape != self.s.shape[1:]:
+            self.s = list(self.s)
+        k = self.n % self.size
+        self.i[k], self.e[k], self.v[k] = i, evals, val
+        # Copy, as templates may modify their solutions in place.
+        self.s[k] = sol if isinstance(self.s, np.ndarray) else np.array(sol)
+        self.n += 1
+        return True
+
+    def __len__(self):
+        return min(self.n, self.size)
+
+    def order(self):
+        """Indices of the recorded iterations, in the order of the iterations."""
+        if self.n <= self.size:
+            return np.arange(self.n)
+        return (np.arange(self.size) + self.n) % self.size
+
+    def its(self):
+        return self.i[self.order()]
+
+    def evals(self):
+        return self.e[self.order()]
+
+    def values(self):
+        return self.v[self.order()]
+
+    def solutions(self):
+        if isinstance(self.s, np.ndarray):
+            return self.s[self.order()]
+        return [self.s[k] for k in self.order()]
+
+    def __getitem__(self, k):
+        k = self.order()[k]
+        return self.v[k], self.s[k]
+
+
+def trajectory(i, val, sol, evals, trajectory):
+    """Record the number of evaluations and the value of all iterations."""
+    trajectory.append((evals,val))
+    return True
+
+
+class progress:
+    """Report the progress of a run on stderr, at a limited rate.
+
+    Calls only store the iteration number, the value and the number of evaluations.
+    They are written by a background thread every period seconds,
+    or, if every is given, by the call of every k-th iteration instead,
+    along with the iterations and evaluations per second since the previous report.
+    The format may use the it, val, evals, its_per_sec and evals_per_sec fields.
+    Call stop at the end of the run, to write the last state and stop the thread.
+    """
+
+    def __init__(self, period=0.5, every=None, fmt="\r{it} {val} ({its_per_sec:.0f} it/s, {evals_per_sec:.0f} evals/s)", stream=sys.stderr):
+        self.period = period
+        self.every = every
+        self.fmt = fmt
+        self.stream = stream
+        self.state = None
+        self.last = (0, 0, time.perf_counter())
+        self.done = threading.Event()
+        self.thread = None
+        if every is None:
+            self.thread = threading.Thread(target=self.loop, daemon=True)
+            self.thread.start()
+
+    def __call__(self, i, val, sol, evals):
+        # A single assignment, so that the thread never reads a partial state.
+        self.state = (i, val, evals)
+        if self.every is not None and i % self.every == 0:
+            self.report()
+        return True # No incidence on termination.
+
+    def report(self):
+        if self.state is None:
+            return
+        i, val, evals = self.state
+        it0, evals0, t0 = self.last
+        if i == it0:
+            return # Nothing new.
+        now = time.perf_counter()
+        # Note that max is a stopping criterion, here.
+        elapsed = np.maximum(now - t0, 1e-9)
+        self.stream.write(self.fmt.format(it=i, val=val, evals=evals,
+                its_per_sec=(i-it0)/elapsed, evals_per_sec=(evals-evals0)/elapsed))
+        self.stream.flush()
+        self.last = (i, evals, now)
+
+    def loop(self):
+        while not self.done.wait(self.period):
+            self.report()
+
+    def stop(self):
+        """Stop the thread and write the last state."""
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.report()
+
+
+def log(i, val, sol, evals, fmt="{it} {val}\n"):
     """Print progress on stderr."""
-    sys.stderr.write( fmt.format(it=i, val=val) )
+    sys.stderr.write( fmt.format(it=i, evals=evals, val=val) )
     return True
 
@@ -1,5 +1,80 @@
 """Wrappers that captures parameters of a function
 and returns an operator with a given interface."""
+import time
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+# Set to a profile instance to instrument the operators made afterwards.
+profiler = None
+
+# Random number generator of the operators and templates to which none is given.
+shared_rng = np.random.default_rng()
+
+
+def generator(rng=None):
+    """Return the given numpy.random.Generator, or the shared one if it is None.
+
+    Operators and templates take an optional rng argument,
+    to be captured by init and neig for operators,
+    so that seeded runs are reproducible and do not share hidden state."""
+    return shared_rng if rng is None else rng
+
+
+class profile:
+    """Count the calls and measure the cumulative wall time of operators.
+
+    While an instance is set as make.profiler, the operators
+    made by the functions of this module are wrapped so as to update
+    its statistics, under names such as "func:sho.num.cover_sum"
+    (the kind of operator, the module and the name of the function or class).
+    Operators made before, or while profiler is None, have no overhead.
+    Other operators, like an iters.pipeline or the methods of a stateful
+    objective function (cover_delta), are profiled if they are wrapped
+    or instrumented explicitly, as snp.py does.
+    Times are inclusive: the time of a stopping criterion made with
+    iters.several or of an iters.pipeline also counts the time
+    of its sub-criterions and hooks.
+    """
+
+    def __init__(self):
+        self.stats = {}
+
+    def wrap(self, kind, op, f):
+        if not hasattr(op, "__name__"):
+            op = type(op)
+        return self.timed("{}:{}.{}".format(kind, op.__module__, op.__name__), f)
+
+    def instrument(self, kind, obj, methods):
+        """Replace the given methods of the object obj by profiled ones,
+        under names such as "func:sho.num.cover_delta.move"."""
+        cls = type(obj)
+        for method in methods:
+            setattr(obj, method, self.timed("{}:{}.{}.{}".format(kind, cls.__module__, cls.__name__, method), getattr(obj, method)))
+
+    def timed(self, name, f):
+        stat = self.stats.setdefault(name, [0, 0.])
+        clock = time.perf_counter
+        def g(*args):
+            start = clock()
+            res = f(*args)
+            stat[1] += clock() - start
+            stat[0] += 1
+            return res
+        return g
+
+    def report(self):
+        """Return a dictionary holding the number of calls, the cumulative
+        and the mean time (in seconds) of each operator called at least once,
+        by decreasing cumulative time."""
+        return {name: {"calls": calls, "time": t, "mean": t / calls}
+                for name,(calls,t) in sorted(self.stats.items(), key=lambda s: -s[1][1]) if calls > 0}
+
+    def __str__(self):
+        lines = ["{:<40} {:>10} {:>12} {:>12}".format("operator", "calls", "time (s)", "mean (s)")]
+        for name,s in self.report().items():
+            lines.append("{:<40} {:>10} {:>12.6f} {:>12.3e}".format(name, s["calls"], s["time"], s["mean"]))
+        return "\n".join(lines)
 
 
 def func(cover, **kwargs):
@@ -7,7 +82,133 @@ def func(cover, **kwargs):
     An objective function takes a solution and returns a scalar."""
     def f(sol):
         return cover(sol,**kwargs)
-    return f
+    return f if profiler is None else profiler.wrap("func", cover, f)
+
+
+class cache:
+    """Make an objective function remembering the values of the last
+    maxsize solutions it evaluated, evicting the least recently used.
+
+    Solutions are identified by a hash of their bytes, so that
+    a solution modified in place is evaluated again.
+    If batch_func is given, the batch method is the batch objective function
+    sharing the same memory, which only evaluates the solutions it misses.
+    The number of hits and misses are counted.
+    """
+
+    def __init__(self, func, maxsize = 1024, batch_func = None):
+        assert(maxsize > 0)
+        self.func = func
+        self.batch_func = batch_func
+        self.maxsize = maxsize
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, sol):
+        return hashlib.blake2b(np.ascontiguousarray(sol).tobytes(), digest_size=16).digest()
+
+    def remember(self, key, val):
+        self.memory[key] = val
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def __call__(self, sol):
+        key = self.key(sol)
+        if key in self.memory:
+            self.hits += 1
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        self.misses += 1
+        val = self.func(sol)
+        self.remember(key, val)
+        return val
+
+    def batch(self, sols):
+        keys = [self.key(s) for s in sols]
+        vals = np.empty(len(keys))
+        missed = []
+        for k,key in enumerate(keys):
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                vals[k] = self.memory[key]
+            else:
+                missed.append(k)
+        self.hits += len(keys) - len(missed)
+        self.misses += len(missed)
+        if len(missed) > 0:
+            if isinstance(sols, np.ndarray):
+                vals[missed] = self.batch_func(sols[missed])
+            else:
+                vals[missed] = self.batch_func([sols[k] for k in missed])
+            for k in missed:
+                self.remember(keys[k], vals[k])
+        return vals
+
+    def __str__(self):
+        return "{} hits, {} misses".format(self.hits, self.misses)
+
+
+class screen:
+    """Make a multi-fidelity batch objective function, screening a population
+    with the cheap approximation coarse (a batch obj. func.) and evaluating
+    only the best fraction of it with batch_func.
+
+    The other solutions get a value of -inf, so that templates reject them.
+    The number of exact evaluations made by the last call is kept, and
+    the calls, candidates and exact evaluations are counted.
+    Every audit calls (never if 0), the rejected solutions are evaluated too
+    (without changing their values), those better than the worst kept one
+    being counted as ranking errors.
+    """
+
+    def __init__(self, coarse, batch_func, fraction = 0.5, audit = 0):
+        assert(0 < fraction <= 1)
+        self.coarse = coarse
+        self.batch_func = batch_func
+        self.fraction = fraction
+        self.audit = audit
+        self.last = 0
+        self.calls = 0
+        self.candidates = 0
+        self.evals = 0
+        self.audited = 0
+        self.errors = 0
+
+    def exact(self, sols, keys):
+        if isinstance(sols, np.ndarray):
+            return self.batch_func(sols[keys])
+        return self.batch_func([sols[k] for k in keys])
+
+    def __call__(self, sols):
+        self.calls += 1
+        scores = np.asarray(self.coarse(sols), dtype=float)
+        n = len(scores)
+        keep = np.argsort(-scores, kind="stable")[:max(1, int(np.ceil(self.fraction * n)))]
+        vals = np.full(n, -np.inf)
+        vals[keep] = self.exact(sols, keep)
+        self.last = len(keep)
+        if self.audit and self.calls % self.audit == 0 and len(keep) < n:
+            rejected = np.setdiff1d(np.arange(n), keep)
+            self.errors += int(np.sum(self.exact(sols, rejected) > np.min(vals[keep])))
+            self.audited += len(rejected)
+            self.last += len(rejected)
+        self.candidates += n
+        self.evals += self.last
+        return vals
+
+    def __str__(self):
+        return "{} exact evaluations of {} candidates ({:.0%} saved), {} ranking errors in {} audited".format(
+                self.evals, self.candidates, 1 - self.evals / max(1, self.candidates), self.errors, self.audited)
+
+
+def batch_func(cover, **kwargs):
+    """Make a batch objective function from the given function.
+    A batch obj. func. takes a population of solutions
+    and returns an array of scalars."""
+    def f(sols):
+        return cover(sols,**kwargs)
+    return f if profiler is None else profiler.wrap("batch_func", cover, f)
 
 
 def init(init, **kwargs):
@@ -15,7 +216,7 @@ def init(init, **kwargs):
     An init. op. returns a solution."""
     def f():
         return init(**kwargs)
-    return f
+    return f if profiler is None else profiler.wrap("init", init, f)
 
 
 def neig(neighb, **kwargs):
@@ -23,13 +224,13 @@ def neig(neighb, **kwargs):
     A neighb. op. takes a solution and returns another one."""
     def f(sol):
         return neighb(sol, **kwargs)
-    return f
+    return f if profiler is None else profiler.wrap("neig", neighb, f)
 
 
 def iter(iters, **kwargs):
     """Make an iterations operator from the given function.
-    A iter. op. takes a value and a solution and returns
-    the current number of iterations."""
-    def f(i, val, sol):
-        return iters(i, val, sol, **kwargs)
-    return f
+    A iter. op. takes the current number of iterations, a value, a solution
+    and the current number of evaluations, and returns whether to continue."""
+    def f(i, val, sol, evals):
+        return iters(i, val, sol, evals, **kwargs)
+    return f if profiler is None else profiler.wrap("iter", iters, f)
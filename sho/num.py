@@ -1,7 +1,7 @@
 import math
 import numpy as np
 
-from . import pb
+from . import pb, make
 
 ########################################################################
 # Objective functions
@@ -21,7 +21,7 @@ def to_sensors(sol):
     return sensors
 
 
-def cover_sum(sol, domain_width, sensor_range, dim):
+def cover_sum(sol, domain_width, sensor_range, dim, visibility=None):
     """Compute the coverage quality of the given vector."""
     assert(0 < sensor_range <= domain_width * math.sqrt(2))
     assert(0 < domain_width)
@@ -29,90 +29,135 @@ def cover_sum(sol, domain_width, sensor_range, dim):
     assert(len(sol) >= dim)
     domain = np.zeros((domain_width,domain_width))
     sensors = to_sensors(sol)
-    cov = pb.coverage(domain, sensors, sensor_range*domain_width)
+    cov = pb.coverage(domain, sensors, sensor_range*domain_width, visibility)
     s = np.sum(cov)
-    assert(s >= len(sensors))
+    # Sensors on obstacles cover nothing.
+    assert(visibility is not None or s >= len(sensors))
     return s
 
 
+def cover_sum_batch(sols, domain_width, sensor_range, dim, visibility=None):
+    """Compute the coverage quality of every vector of a population,
+    given as a sequence of vectors or a (P, dim) array."""
+    assert(0 < sensor_range <= domain_width * math.sqrt(2))
+    assert(0 < domain_width)
+    assert(dim > 0)
+    sols = np.asarray(sols)
+    assert(sols.shape[1] >= dim)
+    sensors = np.floor(sols).astype(int).reshape(len(sols), -1, 2)
+    return pb.coverage_sum(sensors, domain_width, sensor_range*domain_width, visibility=visibility)
+
+
+def cover_sum_coarse(sols, domain_width, sensor_range, dim, factor):
+    """Approximate the coverage quality of every vector of a population,
+    on the domain downsampled by factor (see pb.coverage_coarse)."""
+    assert(0 < sensor_range <= domain_width * math.sqrt(2))
+    assert(0 < domain_width)
+    assert(dim > 0)
+    sols = np.asarray(sols)
+    sensors = np.floor(sols).astype(int).reshape(len(sols), -1, 2)
+    return pb.coverage_coarse(sensors, domain_width, sensor_range*domain_width, factor)
+
+
+class cover_delta(pb.coverage_counts):
+    """Stateful version of cover_sum, which evaluates a move
+    by updating only the cells covered by the moved sensors."""
+
+    def __init__(self, domain_width, sensor_range, dim):
+        assert(0 < sensor_range <= domain_width * math.sqrt(2))
+        assert(0 < domain_width)
+        assert(dim > 0)
+        super().__init__(to_sensors, domain_width, sensor_range*domain_width)
+
+
 ########################################################################
 # Initialization
 ########################################################################
 
-def rand(dim, scale):
+def rand(dim, scale, rng=None):
     """Draw a random vector in [0,scale]**dim."""
-    return np.random.random(dim) * scale
+    rng = make.generator(rng)
+    return rng.random(dim) * scale
 
 
 ########################################################################
 # Neighborhood
 ########################################################################
 
-def neighb_square(sol, scale, domain_width):
+def neighb_square(sol, scale, domain_width, rng=None):
     """Draw a random vector in a square of witdh `scale` in [0,1]
-    as a fraction of the domain width around the given solution."""
+    as a fraction of the domain width around the given solution
+    (or around every vector of a (P, dim) array)."""
+    rng = make.generator(rng)
     assert(0 < scale <= 1)
     side = domain_width * scale;
-    new = sol + (np.random.random(len(sol)) * side - side/2)
+    new = sol + (rng.random(np.shape(sol)) * side - side/2)
     return new
 
 ########################################################################
 # Crossovers
 ########################################################################
 
-def simple_crossover(sol,neighb,j,p_mut,nb_sensors) :
+def simple_crossover(sol,neighb,j,p_mut,nb_sensors,rng=None,uniform=None) :
+   rng = make.generator(rng)
+   uniform = rng.random if uniform is None else uniform
+   # Random numbers in [0,1) may come from a pool pre-drawn by the template (see algo.uniforms).
    parent1 = sol[j]
-   n = np.random.randint(0,len(sol))
+   n = int(uniform()*len(sol))
    while n == j :
-       n = np.random.randint(0,len(sol))
+       n = int(uniform()*len(sol))
    parent2 = sol[n]
    
    # We compute the crossover operation by placing the second sensor of parent 2 at the position of second sensor of parent 1.
-   child = parent1
+   child = np.copy(parent1)
    child[2:3] = parent2[2:3]
    
    # Finally, we apply the mutation with probability p_mut
-   if np.random.random() < p_mut :
+   if uniform() < p_mut :
    	child = neighb(child)
    return child
 
-def crossover(sample,j,n_ech,neighb,p_mut,nb_sensors) :
+def crossover(sample,j,n_ech,neighb,p_mut,nb_sensors,rng=None,uniform=None) :
+   rng = make.generator(rng)
+   uniform = rng.random if uniform is None else uniform
 
    # We randomly select an element from the sample
-   n = np.random.randint(0,n_ech)
+   n = int(uniform()*n_ech)
    while n == j :
-       n = np.random.randint(0,n_ech)
+       n = int(uniform()*n_ech)
    parent1 = sample[j]
    parent2 = sample[n]
    
    # We compute the crossover operation by placing the second sensor of parent 2 at the position of second sensor of parent 1.
    # The other sensors of parent 1 are in the child population.
-   child = parent1
+   child = np.copy(parent1)
    child[2:3] = parent2[2:3] 		
    
    # Finally, we apply the mutation with probability p_mut
-   if np.random.random() < p_mut :
+   if uniform() < p_mut :
    	child = neighb(child)
    return child
 
-def dict_crossover(dict_sol,sorted_list_keys,ech,key_ech,n_pop,neighb,p_mut,nb_sensors) :
+def dict_crossover(dict_sol,sorted_list_keys,ech,key_ech,n_pop,neighb,p_mut,nb_sensors,rng=None,uniform=None) :
+   rng = make.generator(rng)
+   uniform = rng.random if uniform is None else uniform
    
    # We randomly select an element from the sample
-   n = np.random.randint(0,n_pop)
+   n = int(uniform()*n_pop)
    sol_key_n = sorted_list_keys[n]
    while sol_key_n == key_ech :
-       n = np.random.randint(0,n_pop)
+       n = int(uniform()*n_pop)
        sol_key_n = sorted_list_keys[n]
    parent1 = ech
    parent2 = dict_sol[sol_key_n][0]
    
    # We compute the crossover operation by placing the second sensor of parent 2 at the position of second sensor of parent 1.
    # The other sensors of parent 1 are in the child population.
-   child = parent1
+   child = np.copy(parent1)
    child[2:3] = parent2[2:3] 		
    
    # Finally, we apply the mutation with probability p_mut
-   if np.random.random() < p_mut :
+   if uniform() < p_mut :
    	child = neighb(child)
    return child
 
@@ -1,13 +1,58 @@
-from . import distance
+import os
+import math
+import hashlib
+import functools
+import numpy as np
+from collections import Counter
 
 ########################################################################
 # Objective functions
 ########################################################################
 
-def coverage(domain, sensors, sensor_range):
+@functools.lru_cache(maxsize=None)
+def disk(sensor_range):
+    """Boolean stamp of the cells strictly closer than sensor_range
+    to the central cell of a square of width 2*ceil(sensor_range)+1.
+
+    The stamp is cached per sensor_range and is read-only.
+
+    >>> disk(1.5).astype(int)
+    array([[0, 0, 0, 0, 0],
+           [0, 1, 1, 1, 0],
+           [0, 1, 1, 1, 0],
+           [0, 1, 1, 1, 0],
+           [0, 0, 0, 0, 0]])
+    """
+    k = int(math.ceil(sensor_range))
+    d = np.arange(-k, k+1)
+    stamp = np.sqrt(d[np.newaxis,:]**2 + d[:,np.newaxis]**2) < sensor_range
+    stamp.flags.writeable = False
+    return stamp
+
+
+def window(shape, sensor, k):
+    """Return the slices of a domain of the given shape and the slices
+    of a stamp of half-width k centered on the given (integer) sensor,
+    restricted to their overlapping part."""
+    sx, sy = int(sensor[0]), int(sensor[1])
+    y0, y1 = max(0, sy-k), min(shape[0], sy+k+1)
+    x0, x1 = max(0, sx-k), min(shape[1], sx+k+1)
+    if y0 >= y1 or x0 >= x1:
+        return None
+    return (slice(y0,y1), slice(x0,x1)), \
+           (slice(y0-sy+k, y1-sy+k), slice(x0-sx+k, x1-sx+k))
+
+
+def coverage(domain, sensors, sensor_range, visibility=None):
     """Set a given domain's cells to on if they are visible
     from one of the given sensors at the given sensor_range.
 
+    Sensors on integer coordinates are stamped with the cached `disk`,
+    others are computed on their bounding box, so that the cost
+    is in O(n r²) instead of O(n W²).
+    If a `visibility` index is given, the cells hidden by its obstacles
+    are not covered (sensors being on the cell of their floored coordinates).
+
     >>> coverage(np.zeros((5,5)),[(2,2)],2)
     array([[ 0.,  0.,  0.,  0.,  0.],
            [ 0.,  1.,  1.,  1.,  0.],
@@ -15,15 +60,181 @@ def coverage(domain, sensors, sensor_range):
            [ 0.,  1.,  1.,  1.,  0.],
            [ 0.,  0.,  0.,  0.,  0.]])
     """
-    for py in range(len(domain)):
-        for px in range(len(domain[py])):
-            p = (px,py)
-            for x in sensors:
-                if distance(x,p) < sensor_range:
-                    domain[py][px] = 1
+    shape = np.shape(domain)
+    if visibility is not None:
+        assert(visibility.sensor_range == sensor_range)
+        domain[visibility.covered(sensors).reshape(shape)] = 1
+        return domain
+    stamp = disk(sensor_range)
+    k = (len(stamp)-1) // 2
+    for s in sensors:
+        if float(s[0]).is_integer() and float(s[1]).is_integer():
+            w = window(shape, s, k)
+            if w is not None:
+                domain[w[0]][stamp[w[1]]] = 1
+        else:
+            # Off-grid sensor, compute the distances on its bounding box.
+            y0 = max(0, int(math.ceil(s[1]-sensor_range)))
+            y1 = min(shape[0], int(math.floor(s[1]+sensor_range))+1)
+            x0 = max(0, int(math.ceil(s[0]-sensor_range)))
+            x1 = min(shape[1], int(math.floor(s[0]+sensor_range))+1)
+            if y0 >= y1 or x0 >= x1:
+                continue
+            px = np.arange(x0, x1)
+            py = np.arange(y0, y1)
+            d = np.sqrt( (s[0]-px[np.newaxis,:])**2 + (s[1]-py[:,np.newaxis])**2 )
+            domain[y0:y1, x0:x1][d < sensor_range] = 1
     return domain
 
 
+def coverage_sum(sensors, domain_width, sensor_range, nb=None, visibility=None, chunk=2**22):
+    """Number of cells covered by each set of sensors of a population.
+
+    sensors is an integer array of shape (P, n, 2) holding the (x,y)
+    coordinates of n sensors for P solutions. If given, nb holds the
+    number of actual sensors of each solution, the next ones being ignored.
+    The covered cells of each row are the union of one interval per sensor,
+    so that the whole population is evaluated at once in O(P W n log n).
+    With a `visibility` index, each solution is the union of its
+    precomputed visible cells instead.
+    Large populations are evaluated by chunks of solutions, so that the
+    (P, W, n) temporaries hold about chunk integers at most.
+
+    >>> coverage_sum(np.array([[(2,2)],[(0,0)]]), 5, 2)
+    array([9., 4.])
+    """
+    sensors = np.asarray(sensors, dtype=np.int32)
+    if visibility is not None:
+        assert(visibility.sensor_range == sensor_range)
+        if nb is None:
+            nb = np.full(len(sensors), sensors.shape[1])
+        return np.array([np.count_nonzero(visibility.covered(s[:n])) for s,n in zip(sensors, nb)], dtype=float)
+    size = max(1, chunk // (domain_width * max(1, sensors.shape[1])))
+    if len(sensors) > size:
+        return np.concatenate([coverage_sum(sensors[p:p+size], domain_width, sensor_range,
+                                    None if nb is None else nb[p:p+size], chunk=chunk)
+                               for p in range(0, len(sensors), size)])
+    stamp = disk(sensor_range)
+    k = (len(stamp)-1) // 2
+    # Half-width of the disk on each of its rows, -1 if empty.
+    half = ((np.sum(stamp, axis=1) - 1) // 2).astype(np.int32)
+    sx = sensors[:,np.newaxis,:,0]
+    sy = sensors[:,np.newaxis,:,1]
+    dy = np.arange(domain_width, dtype=np.int32)[np.newaxis,:,np.newaxis] - sy
+    h = np.where(np.abs(dy) <= k, half[np.clip(dy+k, 0, 2*k)], -1)
+    if nb is not None:
+        ignored = np.arange(sensors.shape[1]) >= np.reshape(nb,(-1,1))
+        h = np.where(ignored[:,np.newaxis,:], -1, h)
+    # Half-open intervals of covered cells, on each row (P, W, n).
+    a = np.clip(sx - h, 0, domain_width)
+    b = np.clip(sx + h + 1, 0, domain_width)
+    empty = a >= b
+    a[empty] = 0
+    b[empty] = 0
+    order = np.argsort(a, axis=-1)
+    a = np.take_along_axis(a, order, axis=-1)
+    b = np.take_along_axis(b, order, axis=-1)
+    # Only count the part of each interval after the previous ones' end.
+    reach = np.zeros_like(b)
+    reach[...,1:] = np.maximum.accumulate(b, axis=-1)[...,:-1]
+    length = np.maximum(0, b - np.maximum(a, reach))
+    return np.sum(length, axis=(1,2)).astype(float)
+
+
+def coverage_coarse(sensors, domain_width, sensor_range, factor, nb=None):
+    """Approximate `coverage_sum` on the domain downsampled by the given
+    integer factor, each square of factor×factor cells being a single cell.
+    The result is scaled back to a number of cells of the domain.
+
+    >>> coverage_coarse(np.array([[(4,4)],[(0,0)]]), 10, 4, 2)
+    array([36., 16.])
+    """
+    assert(factor >= 1)
+    width = int(math.ceil(domain_width / factor))
+    sensors = np.asarray(sensors, dtype=int) // factor
+    return coverage_sum(sensors, width, sensor_range / factor, nb) * factor**2
+
+
+class coverage_counts:
+    """Stateful coverage objective, which holds the number of sensors
+    covering each cell for a current solution, so that moving sensors
+    only updates the cells inside their old and new disks.
+
+    Calling the instance evaluates a solution from scratch.
+    The move interface used by the algorithm templates is:
+    - reset(sol): make sol the current solution and return its value,
+    - move(sol): apply the move from the current solution to sol
+      and return the value of sol,
+    - commit(): keep the last move,
+    - revert(): undo the last move.
+    Each move should be followed by either a commit or a revert.
+    """
+
+    def __init__(self, to_sensors, domain_width, sensor_range):
+        self.to_sensors = to_sensors
+        self.shape = (domain_width, domain_width)
+        self.sensor_range = sensor_range
+        self.stamp = disk(sensor_range)
+        self.k = (len(self.stamp)-1) // 2
+        self.counts = np.zeros(self.shape, dtype=np.int32)
+        self.covered = 0
+        self.sensors = Counter()
+        self.pending = None
+
+    def __call__(self, sol):
+        domain = np.zeros(self.shape)
+        return np.sum(coverage(domain, self.to_sensors(sol), self.sensor_range))
+
+    def add(self, sensor):
+        w = window(self.shape, sensor, self.k)
+        if w is not None:
+            cells, stamp = self.counts[w[0]], self.stamp[w[1]]
+            if self.pending is not None:
+                self.pending.append((w[0], cells.copy()))
+            cells += stamp
+            self.covered += np.count_nonzero(stamp & (cells == 1))
+
+    def remove(self, sensor):
+        w = window(self.shape, sensor, self.k)
+        if w is not None:
+            cells, stamp = self.counts[w[0]], self.stamp[w[1]]
+            if self.pending is not None:
+                self.pending.append((w[0], cells.copy()))
+            cells -= stamp
+            self.covered -= np.count_nonzero(stamp & (cells == 0))
+
+    def reset(self, sol):
+        self.counts[:] = 0
+        self.covered = 0
+        self.sensors = Counter(self.to_sensors(sol))
+        self.pending = None
+        for s in self.sensors.elements():
+            self.add(s)
+        return float(self.covered)
+
+    def move(self, sol):
+        assert(self.pending is None)
+        sensors = Counter(self.to_sensors(sol))
+        # Keep the previous state of the updated cells, for revert.
+        self.pending = [(self.sensors, self.covered)]
+        for s in (self.sensors - sensors).elements():
+            self.remove(s)
+        for s in (sensors - self.sensors).elements():
+            self.add(s)
+        self.sensors = sensors
+        return float(self.covered)
+
+    def commit(self):
+        self.pending = None
+
+    def revert(self):
+        self.sensors, self.covered = self.pending[0]
+        # Restore in reverse order, as windows may overlap.
+        for cells, previous in reversed(self.pending[1:]):
+            self.counts[cells] = previous
+        self.pending = None
+
+
 def line(x0, y0, x1, y1):
     """Compute the set of pixels (integer coordinates) of the line
     between the given line (x0,y0) -> (x1,y1).
@@ -41,7 +252,7 @@ def line(x0, y0, x1, y1):
     if dy > 0:
         ys = 1
     else:
-        xs = -1
+        ys = -1
 
     dx = abs(dx)
     dy = abs(dy)
@@ -62,5 +273,128 @@ def line(x0, y0, x1, y1):
             y += 1
             D -= 2 * dx
 
-    D += 2 * dy
+        D += 2 * dy
+
+
+
+########################################################################
+# Line of sight
+########################################################################
+
+@functools.lru_cache(maxsize=None)
+def rays(sensor_range):
+    """Lines from a sensor to the cells of its `disk`, relative to the sensor.
+
+    Return an (m, 2) array of the (dx,dy) offsets of the m cells of the disk,
+    and the tuple of the m arrays of the offsets of the cells of their lines
+    (see `line`). They are cached per sensor_range.
+    """
+    stamp = disk(sensor_range)
+    k = (len(stamp)-1) // 2
+    dys, dxs = np.nonzero(stamp)
+    offsets = np.stack((dxs-k, dys-k), axis=-1)
+    offsets.flags.writeable = False
+    return offsets, tuple(np.array(list(line(0, 0, dx, dy))) for dx,dy in offsets.tolist())
+
+
+class visibility:
+    """Line-of-sight coverage of a domain with obstacles,
+    precomputed for every cell on which a sensor may be.
+
+    obstacles is a boolean array of the shape of the domain, true on walls.
+    A cell is covered by a sensor if it is strictly closer than sensor_range
+    (as in `disk`) and if none of the cells of the `line` between them
+    is an obstacle, both ends included: sensors on walls cover nothing,
+    and sensors outside of the domain are ignored.
+
+    The flat indices (y*width+x) of the cells covered from the cell
+    of flat index c are indices[indptr[c]:indptr[c+1]], as in a CSR matrix,
+    so that evaluating a solution is a lookup and a union.
+    Use `load_visibility` or `cached_visibility` to read a saved index.
+    """
+
+    def __init__(self, obstacles, sensor_range, indptr=None, indices=None):
+        self.obstacles = np.asarray(obstacles, dtype=bool)
+        self.sensor_range = sensor_range
+        if indptr is None:
+            indptr, indices = self.index()
+        self.indptr = indptr
+        self.indices = indices
+
+    def index(self, tile=2**20):
+        """Trace the line to each cell of the disk from all the cells at once,
+        on the obstacles surrounded by walls (so that cells outside are not covered).
+        Sensors are processed by tiles of rows, of about tile (offset, sensor) pairs,
+        so that only the index itself grows with the domain."""
+        h, w = self.obstacles.shape
+        offsets, lines = rays(self.sensor_range)
+        k = int(math.ceil(self.sensor_range))
+        walls = np.pad(self.obstacles, k, constant_values=True)
+        rows = max(1, tile // (len(offsets) * w))
+        indices = []
+        counts = np.empty(h*w, dtype=np.int64)
+        for y in range(0, h, rows):
+            t = min(rows, h-y)
+            # Visible cells, for each offset and each sensor of the tile (m, t, w).
+            visible = np.empty((len(offsets), t, w), dtype=bool)
+            for j,cells in enumerate(lines):
+                blocked = np.zeros((t, w), dtype=bool)
+                for dx,dy in cells.tolist():
+                    blocked |= walls[k+y+dy:k+y+dy+t, k+dx:k+dx+w]
+                np.logical_not(blocked, out=visible[j])
+            # Group by sensor, in the order of the offsets.
+            sy, sx, j = np.nonzero(visible.transpose(1,2,0))
+            indices.append(((sy + y + offsets[j,1]) * w + sx + offsets[j,0]).astype(np.int32))
+            counts[y*w:(y+t)*w] = visible.sum(axis=0, dtype=np.int64).ravel()
+        indptr = np.zeros(h*w+1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return indptr, np.concatenate(indices)
+
+    def covered(self, sensors):
+        """Boolean flat array of the cells covered by the given sensors."""
+        h, w = self.obstacles.shape
+        mask = np.zeros(h*w, dtype=bool)
+        for x,y in sensors:
+            x, y = int(math.floor(x)), int(math.floor(y))
+            if 0 <= x < w and 0 <= y < h:
+                c = y*w + x
+                mask[self.indices[self.indptr[c]:self.indptr[c+1]]] = True
+        return mask
+
+    def digest(self):
+        """Hash of the obstacles and of the sensor range."""
+        return visibility_digest(self.obstacles, self.sensor_range)
+
+    def save(self, filename):
+        """Save the index to a .npz file."""
+        np.savez(filename, obstacles=self.obstacles, sensor_range=self.sensor_range,
+                indptr=self.indptr, indices=self.indices)
+
+
+def visibility_digest(obstacles, sensor_range):
+    """Hash identifying the visibility index of the given obstacles and sensor_range."""
+    obstacles = np.asarray(obstacles, dtype=bool)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.array(obstacles.shape + (float(sensor_range),)).tobytes())
+    h.update(np.packbits(obstacles).tobytes())
+    return h.hexdigest()
+
+
+def load_visibility(filename):
+    """Read a visibility index saved as a .npz file."""
+    with np.load(filename) as data:
+        return visibility(data["obstacles"], float(data["sensor_range"]), data["indptr"], data["indices"])
+
 
+def cached_visibility(obstacles, sensor_range, filename=None):
+    """Return the visibility index of the given obstacles and sensor_range,
+    read from filename if it holds the same one,
+    or computed and saved to filename (if given) otherwise."""
+    if filename is not None and os.path.exists(filename):
+        vis = load_visibility(filename)
+        if vis.digest() == visibility_digest(obstacles, sensor_range):
+            return vis
+    vis = visibility(obstacles, sensor_range)
+    if filename is not None:
+        vis.save(filename)
+    return vis
@@ -1,10 +1,15 @@
+import os
+import json
+import hashlib
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from matplotlib import cm
 import matplotlib.pyplot as plt
-import itertools
 from mpl_toolkits.mplot3d import Axes3D
 
-from . import x,y,distance
+from . import x,y,distance,iters
 
 def sphere(x,offset=0.5):
     """Computes the square of a multi-dimensional vector x."""
@@ -14,11 +19,74 @@ def sphere(x,offset=0.5):
     return -1 * f
 
 
-def surface(ax, shape, f):
-    Z = np.zeros( shape )
-    for y in range(shape[0]):
-        for x in range(shape[1]):
-            Z[y][x] = f( (x,y) )
+def tile(f, rows, width, batch=False):
+    """Values of f on the cells (x,y) of the given rows of a domain,
+    as a (len(rows), width) array.
+    If batch is true, f is a batch objective function,
+    called once with the (n,2) array of the cells."""
+    ys, xs = np.meshgrid(rows, np.arange(width), indexing="ij")
+    cells = np.stack((xs.ravel(), ys.ravel()), axis=-1)
+    if batch:
+        vals = f(cells)
+    else:
+        vals = [f(c) for c in map(tuple, cells.tolist())]
+    return np.reshape(np.asarray(vals, dtype=float), (len(rows), width))
+
+
+# Objective function of the worker processes of landscape.
+objective = None
+
+def set_objective(f, batch):
+    global objective
+    objective = (f, batch)
+
+
+def objective_tile(rows, width):
+    return tile(objective[0], rows, width, objective[1])
+
+
+def landscape(shape, f, batch=False, tile_rows=16, processes=1, filename=None):
+    """Values of f on every cell (x,y) of a domain of the given shape,
+    as an array Z such that Z[y][x] = f((x,y)).
+
+    The domain is cut in tiles of tile_rows rows, each evaluated in one call
+    if f is a batch objective function (see `tile`), and the tiles
+    are shared by a pool of the given number of (forked) processes.
+    If filename is given, Z is read from this .npy file if it exists,
+    and saved in it otherwise (see `landscape_file`)."""
+    if filename is not None and os.path.exists(filename):
+        Z = np.load(filename)
+        if Z.shape == tuple(shape):
+            return Z
+    tiles = [np.arange(y, min(y+tile_rows, shape[0])) for y in range(0, shape[0], tile_rows)]
+    if processes > 1:
+        # The objective is inherited by the forked workers, as it may not be picklable.
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork"),
+                initializer=set_objective, initargs=(f, batch)) as pool:
+            parts = list(pool.map(objective_tile, tiles, [shape[1]] * len(tiles)))
+    else:
+        parts = [tile(f, rows, shape[1], batch) for rows in tiles]
+    Z = np.concatenate(parts)
+    if filename is not None:
+        # Replace atomically, so that a concurrent plot never reads a partial file.
+        tmp = filename + ".tmp.npy"
+        np.save(tmp, Z)
+        os.replace(tmp, filename)
+    return Z
+
+
+def landscape_file(directory=".", **params):
+    """Name of the .npy file caching the landscape of the objective function
+    with the given parameters, in the given directory."""
+    key = json.dumps(params, sort_keys=True, default=str)
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    return os.path.join(directory, "landscape_{}.npy".format(digest))
+
+
+def surface(ax, shape, f, **kwargs):
+    """Plot the landscape of f on a domain of the given shape.
+    Other arguments are those of `landscape`."""
+    Z = landscape(shape, f, **kwargs)
 
     X = np.arange(0,shape[0],1)
     Y = np.arange(0,shape[1],1)
@@ -28,19 +96,25 @@ def surface(ax, shape, f):
 
 
 def path(ax, shape, history):
+    """Plot the trajectory of the first sensor in a history,
+    either an iters.recorder or a list of (value, solution) pairs."""
     def pairwise(iterable):
         a, b = itertools.tee(iterable)
         next(b, None)
         return zip(a, b)
 
+    if isinstance(history, iters.recorder):
+        vals, sols = history.values(), history.solutions()
+    else:
+        vals, sols = [h[0] for h in history], [h[1] for h in history]
     k=0
-    for i,j in pairwise(range(len(history)-1)):
-        xi = history[i][1][0]
-        yi = history[i][1][1]
-        zi = history[i][0]
-        xj = history[j][1][0]
-        yj = history[j][1][1]
-        zj = history[j][0]
+    for i,j in pairwise(range(len(vals)-1)):
+        xi = np.ravel(sols[i])[0]
+        yi = np.ravel(sols[i])[1]
+        zi = vals[i]
+        xj = np.ravel(sols[j])[0]
+        yj = np.ravel(sols[j])[1]
+        zj = vals[j]
         x = [xi, xj]
         y = [yi, yj]
         z = [zi, zj]
@@ -0,0 +1,213 @@
+import math
+import numpy as np
+
+from . import pb, make
+
+########################################################################
+# Encoding
+########################################################################
+
+# Same solutions as the bit encoding, but stored as an (n,2) array
+# of the (x,y) coordinates of the ones, in the order of the rows of the grid.
+# Memory and time thus depend on the number of sensors, instead of W².
+
+def sort(coords):
+    """Sort coordinates in the order of the rows, then of the columns,
+    of the grid (that is, the order of bit.to_sensors)."""
+    coords = np.asarray(coords, dtype=int).reshape(-1,2)
+    return coords[np.lexsort((coords[:,0], coords[:,1]))]
+
+
+def from_dense(sol):
+    """Convert a square array containing n ones
+    to an array of their n coordinates.
+
+    >>> from_dense([[1,0],[1,0]])
+    array([[0, 0],
+           [0, 1]])
+    """
+    ys,xs = np.nonzero(np.asarray(sol) == 1)
+    return np.stack((xs,ys), axis=-1)
+
+
+def to_dense(sol, domain_width):
+    """Convert an array of coordinates to a square array
+    of domain_width lines/columns containing ones at those coordinates."""
+    domain = np.zeros( (domain_width,domain_width) )
+    domain[sol[:,1], sol[:,0]] = 1
+    return domain
+
+
+def occupancy(sol):
+    """Set of the coordinates of the given solution."""
+    return set(map(tuple, sol.tolist()))
+
+
+########################################################################
+# Objective functions
+########################################################################
+
+def to_sensors(sol):
+    """Convert an array of coordinates to a list of 2-tuples.
+
+    >>> to_sensors(np.array([[0,0],[0,1]]))
+    [(0, 0), (0, 1)]
+    """
+    assert(len(sol)>0)
+    return list(map(tuple, sol.tolist()))
+
+
+def cover_sum(sol, domain_width, sensor_range, dim, visibility=None):
+    """Compute the coverage quality of the given coordinates."""
+    assert(0 < sensor_range <= math.sqrt(2))
+    assert(0 < domain_width)
+    assert(dim > 0)
+    domain = np.zeros((domain_width,domain_width))
+    sensors = to_sensors(sol)
+    cov = pb.coverage(domain, sensors, sensor_range*domain_width, visibility)
+    s = np.sum(cov)
+    # Sensors on obstacles cover nothing.
+    assert(visibility is not None or s >= len(sensors))
+    return s
+
+
+def cover_sum_batch(sols, domain_width, sensor_range, dim, visibility=None):
+    """Compute the coverage quality of every solution of a population,
+    which may not all have the same number of sensors."""
+    assert(0 < sensor_range <= math.sqrt(2))
+    assert(0 < domain_width)
+    assert(dim > 0)
+    nb = np.array([len(s) for s in sols])
+    sensors = np.zeros((len(sols), np.max(nb), 2), dtype=int)
+    for k,s in enumerate(sols):
+        sensors[k,:len(s)] = s
+    return pb.coverage_sum(sensors, domain_width, sensor_range*domain_width, nb, visibility)
+
+
+def cover_sum_coarse(sols, domain_width, sensor_range, dim, factor):
+    """Approximate the coverage quality of every solution of a population,
+    on the domain downsampled by factor (see pb.coverage_coarse)."""
+    assert(0 < sensor_range <= math.sqrt(2))
+    assert(0 < domain_width)
+    assert(dim > 0)
+    nb = np.array([len(s) for s in sols])
+    sensors = np.zeros((len(sols), np.max(nb), 2), dtype=int)
+    for k,s in enumerate(sols):
+        sensors[k,:len(s)] = s
+    return pb.coverage_coarse(sensors, domain_width, sensor_range*domain_width, factor, nb)
+
+
+class cover_delta(pb.coverage_counts):
+    """Stateful cover_sum, which only updates the disks
+    of the coordinates that changed when evaluating a neighbor."""
+
+    def __init__(self, domain_width, sensor_range, dim):
+        assert(0 < sensor_range <= math.sqrt(2))
+        assert(0 < domain_width)
+        assert(dim > 0)
+        super().__init__(to_sensors, domain_width, sensor_range*domain_width)
+
+
+########################################################################
+# Initialization
+########################################################################
+
+def rand(domain_width, nb_sensors, rng=None):
+    """"Draw nb_sensors random coordinates, merging duplicates
+    (as does bit.rand)."""
+    rng = make.generator(rng)
+    coords = rng.integers(0, domain_width, (nb_sensors, 2))
+    return sort(np.unique(coords, axis=0))
+
+
+########################################################################
+# Neighborhood
+########################################################################
+
+def neighb_square(sol, scale, domain_width, rng=None):
+    """Draw random coordinates by moving every sensors to adjacent cells,
+    with the same rules as bit.neighb_square."""
+    rng = make.generator(rng)
+    assert(0 < scale <= 1)
+    # Draw in (y,x) order, as bit.neighb_square.
+    pos = sol[:,::-1]
+    w = scale/2 * domain_width
+    moved = rng.integers((pos-w).astype(int), (pos+w).astype(int))
+    moved = np.clip(moved, 0, domain_width-1)
+
+    cells = pos[:,0] * domain_width + pos[:,1]
+    targets = moved[:,0] * domain_width + moved[:,1]
+    first = np.zeros(len(sol), dtype=bool)
+    first[np.unique(targets, return_index=True)[1]] = True
+    accept = first & ~np.isin(targets, cells)
+
+    new = np.array(sol)
+    new[accept] = moved[accept,::-1]
+    return sort(new)
+
+########################################################################
+# Crossover
+########################################################################
+
+def remove_second(parent):
+    """Copy of the given coordinates, without the second sensor."""
+    if len(parent) < 2:
+        return np.array(parent)
+    return np.delete(parent, 1, axis=0)
+
+
+def add_second(child, parent):
+    """Add the second sensor of the given parent to the child,
+    if it is not already there."""
+    if len(parent) < 2 or tuple(parent[1]) in occupancy(child):
+        return child
+    return sort(np.vstack((child, parent[1:2])))
+
+
+def simple_crossover(sol,neighb,j,p_mut,nb_sensors,rng=None,uniform=None) :
+   rng = make.generator(rng)
+   uniform = rng.random if uniform is None else uniform
+   # uniform may draw from a pool of pre-drawn random numbers (see algo.uniforms).
+
+   parent1 = sol[j]
+   n = int(uniform()*len(sol))
+   while n == j :
+       n = int(uniform()*len(sol))
+   parent2 = sol[n]
+
+   # We compute the crossover operation by placing the second sensor of parent 2 at the position of second sensor of parent 1.
+   # The other sensors of parent 1 are in the child population.
+   child = add_second(remove_second(parent1), parent2)
+
+   if not len(child) == nb_sensors :
+   	child = neighb(parent1)
+
+   # Finally, we apply the mutation with probability p_mut
+   if uniform() < p_mut :
+   	child = neighb(child)
+   return child
+
+def crossover(sol,j,n_pop,neighb,p_mut,nb_sensors,rng=None,uniform=None) :
+   rng = make.generator(rng)
+   uniform = rng.random if uniform is None else uniform
+
+   # We compute the crossover operation by placing the second sensor of parent 2 at the position of second sensor of parent 1.
+   # The other sensors of parent 1 are in the child population.
+
+   # We consider parent 1 as the element of the selected sample.
+   parent1 = sol[n_pop+j]
+   child = remove_second(parent1)
+
+   # The second sensor of parent 2 is copied in the child.
+   # We select the new parent 2 in the population until the child has the right number of sensors.
+   bad_number_sensors = True
+   while bad_number_sensors :
+	   n = int(uniform()*n_pop)
+	   child = add_second(child, sol[n])
+	   if len(child) == nb_sensors :
+	   	bad_number_sensors = False
+
+   # Finally, we apply the mutation with probability p_mut
+   if uniform() < p_mut :
+   	child = neighb(child)
+   return child
@@ -1,20 +1,33 @@
 #encoding: utf-8
+import os
+import sys
+import json
+import time
 import math
+import queue
+import argparse
+import functools
+import traceback
+import multiprocessing
 import numpy as np
 import matplotlib.pyplot as plt
 
-from sho import make, algo, iters, plot, num, bit, pb
+from sho import make, algo, iters, plot, num, bit, sparse, pb
 
 ########################################################################
 # Interface
 ########################################################################
 
-if __name__=="__main__":
-    import argparse
+# Dimension of the search space.
+d = 2
+
+
+# Solvers which can save their state in a snapshot, and resume from it.
+snapshots = ["num_annealing", "bit_annealing", "sparse_annealing", "num_evolution", "bit_evolution", "sparse_evolution"]
 
-    # Dimension of the search space.
-    d = 2
 
+def arguments():
+    """Make the command line parser of the solvers."""
     can = argparse.ArgumentParser()
 
     can.add_argument("-n", "--nb-sensors", metavar="NB", default=3, type=int,
@@ -29,13 +42,19 @@ if __name__=="__main__":
     can.add_argument("-i", "--iters", metavar="NB", default=100, type=int,
             help="Maximum number of iterations")
 
+    can.add_argument("--budget", metavar="NB", default=None, type=int,
+            help="Maximum number of objective function evaluations (no limit by default)")
+
     can.add_argument("-s", "--seed", metavar="VAL", default=None, type=int,
             help="Random pseudo-generator seed (none for current epoch)")
 
-    solvers = ["num_greedy","bit_greedy", "num_annealing", "bit_annealing", "num_evolution", "bit_evolution","num_simple_evolution","bit_simple_evolution","num_dict_evolution"]
+    solvers = ["num_greedy","bit_greedy", "num_annealing", "bit_annealing", "num_evolution", "bit_evolution","num_simple_evolution","bit_simple_evolution","num_dict_evolution","sparse_greedy","sparse_annealing","sparse_evolution","num_island_evolution","bit_island_evolution","num_tempering","bit_tempering"]
     can.add_argument("-m", "--solver", metavar="NAME", choices=solvers, default="num_greedy",
             help="Solver to use, among: "+", ".join(solvers))
 
+    can.add_argument("--portfolio", metavar="NAME", nargs="+", choices=solvers, default=None,
+            help="Run several solvers in parallel processes (instead of --solver), until one of them reaches the target")
+
     can.add_argument("-t", "--target", metavar="VAL", default=30*30, type=float,
             help="Objective function value target")
 
@@ -51,229 +70,713 @@ if __name__=="__main__":
     can.add_argument("-z", "--ert", metavar="BOOL", default=False, type=bool, #This argument is to determine if the snp.py module is executed by the user or the ert.py module. If it is executed by ert.py, we do not show the graphics from snp.py.
             help="Execute without print in shell and without plot")
 
-    the = can.parse_args()
+    can.add_argument("-d", "--delta", action="store_true",
+            help="Evaluate neighbors incrementally (greedy and annealing solvers)")
 
-    # Minimum checks.
-    assert(0 < the.nb_sensors)
-    assert(0 < the.sensor_range <= math.sqrt(2))
-    assert(0 < the.domain_width)
-    assert(0 < the.iters)
+    can.add_argument("-c", "--cache", metavar="SIZE", default=0, type=int,
+            help="Remember the objective function values of the last SIZE solutions (0 to disable)")
 
-    # Do not forget the seed option,
-    # in case you would start "runs" in parallel.
-    np.random.seed(the.seed)
+    can.add_argument("-b", "--binary", action="store_true",
+            help="Save iterations in a binary file (<solver>.npy) instead of a CSV file")
 
-    if not the.ert :
-    	np.set_printoptions(linewidth = np.inf)
+    can.add_argument("--save-period", metavar="NB", default=1, type=int,
+            help="Only save one iteration every NB ones")
 
+    can.add_argument("--improvements", action="store_true",
+            help="Only save iterations that improve the objective function value (with --binary)")
 
-    # Common termination and checkpointing.
-    history = []
-    iters = make.iter(
-                iters.several,
-                agains = [
-                    make.iter(iters.max,
-                        nb_it = the.iters),
-                    make.iter(iters.save,
-                        filename = the.solver+".csv",
-                        fmt = "{it} ; {val} ; {sol}\n"),
-                    make.iter(iters.log,
-                        fmt="\r{it} {val}"),
-                    make.iter(iters.history,
-                        history = history),
-                    make.iter(iters.target,
-                        target = the.target),
-                    iters.steady(the.steady_delta, the.steady_epsilon)
-                ]
-            )
+    can.add_argument("-k", "--islands", metavar="NB", default=os.cpu_count(), type=int,
+            help="Number of islands (processes) of the island evolution solvers")
+
+    can.add_argument("-p", "--migration-period", metavar="NB", default=10, type=int,
+            help="Number of generations between migrations of the island evolution solvers")
+
+    can.add_argument("--topology", metavar="NAME", choices=["ring","random"], default="ring",
+            help="Islands to which the best solutions migrate, among: ring, random")
+
+    can.add_argument("--replicas", metavar="NB", default=8, type=int,
+            help="Number of chains of the parallel tempering solvers")
+
+    can.add_argument("--swap-period", metavar="NB", default=10, type=int,
+            help="Number of iterations between temperature exchanges of the parallel tempering solvers")
+
+    can.add_argument("--snapshot", metavar="FILE", default=None,
+            help="Save the state of the solver in FILE, every --snapshot-period iterations (solvers: "+", ".join(snapshots)+")")
+
+    can.add_argument("--snapshot-period", metavar="NB", default=100, type=int,
+            help="Number of iterations between snapshots")
+
+    can.add_argument("--resume", action="store_true",
+            help="Continue the run saved in the --snapshot FILE")
+
+    can.add_argument("--screen", metavar="FACTOR", default=None, type=int,
+            help="Screen the offspring of the evolution solvers on the domain downsampled by FACTOR (ignoring obstacles), only evaluating the best ones exactly")
 
-    # Erase the previous file.
-    with open(the.solver+".csv", 'w') as fd:
-        fd.write("# {} {}\n".format(the.solver,the.domain_width))
+    can.add_argument("--screen-fraction", metavar="RATIO", default=0.5, type=float,
+            help="Fraction of the screened offspring evaluated exactly")
+
+    can.add_argument("--screen-audit", metavar="NB", default=0, type=int,
+            help="Also evaluate the rejected offspring every NB generations, to count ranking errors (0 to never)")
+
+    can.add_argument("--obstacles", metavar="FILE", default=None,
+            help="Map of the walls blocking the sensors' line of sight, as a .npy boolean array or a text file of 0/1, of domain width lines/columns")
+
+    can.add_argument("--visibility", metavar="FILE", default=None,
+            help="Cache the line of sight index of the --obstacles in the .npz FILE, reused while they and the range do not change")
+
+    can.add_argument("--progress", metavar="SEC", default=0.5, type=float,
+            help="Seconds between progress reports")
+
+    can.add_argument("--progress-every", metavar="NB", default=None, type=int,
+            help="Report progress every NB iterations instead of periodically")
+
+    can.add_argument("--history", metavar="NB", default=1024, type=int,
+            help="Number of iterations kept in memory for the plot")
+
+    can.add_argument("--history-policy", metavar="NAME", choices=["ring","stride","improvements"], default="stride",
+            help="Iterations kept in memory, among: ring (the last ones), stride (regularly spaced over the whole run), improvements (the last improving ones)")
+
+    can.add_argument("--landscapes", metavar="DIR", default=None,
+            help="Cache the objective function landscapes plotted with one sensor in DIR")
+
+    can.add_argument("--profile", metavar="FILE", nargs="?", const="-", default=None,
+            help="Count calls and time of the operators, print the report or save it in the JSON file FILE")
+
+    # Index of the portfolio worker, to name its output files.
+    can.set_defaults(worker=None)
+
+    return can
+
+
+@functools.lru_cache(maxsize=None)
+def visibility(obstacles, sensor_range, filename=None):
+    """Line of sight index of the obstacles map in the given file,
+    cached in the given .npz file (see pb.cached_visibility)
+    and in memory, for the runs made by the same process."""
+    if obstacles.endswith(".npy"):
+        walls = np.load(obstacles)
+    else:
+        walls = np.loadtxt(obstacles)
+    return pb.cached_visibility(walls.astype(bool), sensor_range, filename)
+
+
+def run(the, iters, snapshot=None, state=None, rng=None):
+    """Assemble the solver named the.solver, with the given parameters
+    and the stopping criterion iters, and run it.
+    The annealing and evolution solvers also take a snapshot operator,
+    and a state from which to resume (see iters.snapshot).
+    Operators and templates draw from the random number generator rng.
+    Return the best value, the best solution and its sensors."""
+    rng = make.generator(rng)
+    vis = None
+    if the.obstacles:
+        vis = visibility(the.obstacles, the.sensor_range * the.domain_width, the.visibility)
+        assert(vis.obstacles.shape == (the.domain_width, the.domain_width))
+    # Objective functions.
+    num_func = make.func(num.cover_sum,
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors,
+                    visibility = vis)
+    bit_func = make.func(bit.cover_sum,
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors,
+                    visibility = vis)
+    sparse_func = make.func(sparse.cover_sum,
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors,
+                    visibility = vis)
+    num_batch = make.batch_func(num.cover_sum_batch,
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors,
+                    visibility = vis)
+    bit_batch = make.batch_func(bit.cover_sum_batch,
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors,
+                    visibility = vis)
+    sparse_batch = make.batch_func(sparse.cover_sum_batch,
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors,
+                    visibility = vis)
+    if the.cache > 0:
+        # The batch functions share the memory of the scalar ones.
+        num_func = make.cache(num_func, maxsize = the.cache, batch_func = num_batch)
+        bit_func = make.cache(bit_func, maxsize = the.cache, batch_func = bit_batch)
+        sparse_func = make.cache(sparse_func, maxsize = the.cache, batch_func = sparse_batch)
+        num_batch, bit_batch, sparse_batch = num_func.batch, bit_func.batch, sparse_func.batch
+
+    # Stateful objective functions, evaluating moves incrementally.
+    num_delta = num.cover_delta(
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors)
+    bit_delta = bit.cover_delta(
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors)
+    sparse_delta = sparse.cover_delta(
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors)
+
+    # Only profile the incremental objective function of the solver.
+    if make.profiler is not None and the.delta:
+        delta = {"num": num_delta, "bit": bit_delta, "sparse": sparse_delta}[the.solver.split("_")[0]]
+        make.profiler.instrument("func", delta, ("reset", "move"))
+
+    # Multi-fidelity screening of the offspring of the evolution solvers.
+    screen = None
+    if the.screen:
+        encoding = {"num": num, "bit": bit, "sparse": sparse}[the.solver.split("_")[0]]
+        screen = make.screen(
+                make.batch_func(encoding.cover_sum_coarse,
+                    domain_width = the.domain_width,
+                    sensor_range = the.sensor_range,
+                    dim = d * the.nb_sensors,
+                    factor = the.screen),
+                {"num": num_batch, "bit": bit_batch, "sparse": sparse_batch}[the.solver.split("_")[0]],
+                fraction = the.screen_fraction,
+                audit = the.screen_audit)
 
     val,sol,sensors = None,None,None
     if the.solver == "num_greedy":
         val,sol = algo.greedy(
-                make.func(num.cover_sum,
-                    domain_width = the.domain_width,
-                    sensor_range = the.sensor_range,
-                    dim = d * the.nb_sensors),
+                num_delta if the.delta else num_func,
                 make.init(num.rand,
                     dim = d * the.nb_sensors,
-                    scale = the.domain_width),
+                    scale = the.domain_width,
+                    rng = rng),
                 make.neig(num.neighb_square,
                     scale = the.variation_scale,
-                    domain_width = the.domain_width),
+                    domain_width = the.domain_width,
+                    rng = rng),
                 iters
             )
         sensors = num.to_sensors(sol)
 
     elif the.solver == "bit_greedy":
         val,sol = algo.greedy(
-                make.func(bit.cover_sum,
-                    domain_width = the.domain_width,
-                    sensor_range = the.sensor_range,
-                    dim = d * the.nb_sensors),
+                bit_delta if the.delta else bit_func,
                 make.init(bit.rand,
                     domain_width = the.domain_width,
-                    nb_sensors = the.nb_sensors),
+                    nb_sensors = the.nb_sensors,
+                    rng = rng),
                 make.neig(bit.neighb_square,
                     scale = the.variation_scale,
-                    domain_width = the.domain_width),
+                    domain_width = the.domain_width,
+                    rng = rng),
                 iters
             )
         sensors = bit.to_sensors(sol)
 
     elif the.solver == "num_annealing":
         val,sol = algo.annealing(
-                make.func(num.cover_sum,
-                    domain_width = the.domain_width,
-                    sensor_range = the.sensor_range,
-                    dim = d * the.nb_sensors),
+                num_delta if the.delta else num_func,
                 make.init(num.rand,
                     dim = d * the.nb_sensors,
-                    scale = the.domain_width),
+                    scale = the.domain_width,
+                    rng = rng),
                 make.neig(num.neighb_square,
                     scale = the.variation_scale,
-                    domain_width = the.domain_width),
+                    domain_width = the.domain_width,
+                    rng = rng),
                 iters,
                 temperature0 = 1000,
-                Lambda = 0.99
+                Lambda = 0.99,
+                snapshot = snapshot,
+                state = state,
+                rng = rng
             )
         sensors = num.to_sensors(sol)
 
     elif the.solver == "bit_annealing":
         val,sol = algo.annealing(
-                make.func(bit.cover_sum,
+                bit_delta if the.delta else bit_func,
+                make.init(bit.rand,
                     domain_width = the.domain_width,
-                    sensor_range = the.sensor_range,
-                    dim = d * the.nb_sensors),
+                    nb_sensors = the.nb_sensors,
+                    rng = rng),
+                make.neig(bit.neighb_square,
+                    scale = the.variation_scale,
+                    domain_width = the.domain_width,
+                    rng = rng),
+                iters,
+                temperature0 = 1000,
+                Lambda = 0.99,
+                snapshot = snapshot,
+                state = state,
+                rng = rng
+            )
+        sensors = bit.to_sensors(sol)
+
+    elif the.solver == "num_tempering":
+        val,sol = algo.tempering(
+                num_func,
+                make.init(num.rand,
+                    dim = d * the.nb_sensors,
+                    scale = the.domain_width,
+                    rng = rng),
+                make.neig(num.neighb_square,
+                    scale = the.variation_scale,
+                    domain_width = the.domain_width,
+                    rng = rng),
+                iters,
+                temperature0 = 1000,
+                Lambda = 0.99,
+                n_replicas = the.replicas,
+                period = the.swap_period,
+                batch_func = num_batch,
+                rng = rng
+            )
+        sensors = num.to_sensors(sol)
+
+    elif the.solver == "bit_tempering":
+        val,sol = algo.tempering(
+                bit_func,
                 make.init(bit.rand,
                     domain_width = the.domain_width,
-                    nb_sensors = the.nb_sensors),
+                    nb_sensors = the.nb_sensors,
+                    rng = rng),
                 make.neig(bit.neighb_square,
                     scale = the.variation_scale,
-                    domain_width = the.domain_width),
+                    domain_width = the.domain_width,
+                    rng = rng),
                 iters,
                 temperature0 = 1000,
-                Lambda = 0.99
+                Lambda = 0.99,
+                n_replicas = the.replicas,
+                period = the.swap_period,
+                batch_func = bit_batch,
+                rng = rng
             )
         sensors = bit.to_sensors(sol)
 
     elif the.solver == "num_simple_evolution":
         val,sol = algo.simple_evolution(
-                make.func(num.cover_sum,
-                    domain_width = the.domain_width,
-                    sensor_range = the.sensor_range,
-                    dim = d * the.nb_sensors),
+                num_func,
                 make.init(num.rand,
                     dim = d * the.nb_sensors,
-                    scale = the.domain_width),
+                    scale = the.domain_width,
+                    rng = rng),
                 make.neig(num.neighb_square,
                     scale = the.variation_scale,
-                    domain_width = the.domain_width),
+                    domain_width = the.domain_width,
+                    rng = rng),
                 iters,
                 n_ech = 2,
                 n_pop = 10,
                 p_mut = 0.8,
                 p_cross = 0.2,
                 simple_crossover = num.simple_crossover,
-                nb_sensors = the.nb_sensors
+                nb_sensors = the.nb_sensors,
+                batch_func = num_batch,
+                rng = rng
             )
         sensors = num.to_sensors(sol)
 
     elif the.solver == "bit_simple_evolution":
         val,sol = algo.simple_evolution(
-                make.func(bit.cover_sum,
-                    domain_width = the.domain_width,
-                    sensor_range = the.sensor_range,
-                    dim = d * the.nb_sensors),
+                bit_func,
                 make.init(bit.rand,
                     domain_width = the.domain_width,
-                    nb_sensors = the.nb_sensors),
+                    nb_sensors = the.nb_sensors,
+                    rng = rng),
                 make.neig(bit.neighb_square,
                     scale = the.variation_scale,
-                    domain_width = the.domain_width),
+                    domain_width = the.domain_width,
+                    rng = rng),
                 iters,
                 n_ech = 2,
                 n_pop = 10,
                 p_mut = 0.8,
                 p_cross = 0.2,
                 simple_crossover = bit.simple_crossover,
-                nb_sensors = the.nb_sensors
+                nb_sensors = the.nb_sensors,
+                batch_func = bit_batch,
+                rng = rng
             )
         sensors = bit.to_sensors(sol)
 
     elif the.solver == "num_evolution":
         val,sol = algo.evolution(
-                make.func(num.cover_sum,
-                    domain_width = the.domain_width,
-                    sensor_range = the.sensor_range,
-                    dim = d * the.nb_sensors),
+                num_func,
                 make.init(num.rand,
                     dim = d * the.nb_sensors,
-                    scale = the.domain_width),
+                    scale = the.domain_width,
+                    rng = rng),
                 make.neig(num.neighb_square,
                     scale = the.variation_scale,
-                    domain_width = the.domain_width),
+                    domain_width = the.domain_width,
+                    rng = rng),
                 iters,
                 n_ech = 45,
                 n_pop = 100,
                 p_mut = 0.8,
                 p_cross = 0.2,
                 crossover = num.crossover,
-                nb_sensors = the.nb_sensors
+                nb_sensors = the.nb_sensors,
+                batch_func = num_batch,
+                snapshot = snapshot,
+                state = state,
+                screen = screen,
+                rng = rng
             )
         sensors = num.to_sensors(sol)
 
     elif the.solver == "bit_evolution":
         val,sol = algo.evolution(
-                make.func(bit.cover_sum,
-                    domain_width = the.domain_width,
-                    sensor_range = the.sensor_range,
-                    dim = d * the.nb_sensors),
+                bit_func,
                 make.init(bit.rand,
                     domain_width = the.domain_width,
-                    nb_sensors = the.nb_sensors),
+                    nb_sensors = the.nb_sensors,
+                    rng = rng),
                 make.neig(bit.neighb_square,
                     scale = the.variation_scale,
-                    domain_width = the.domain_width),
+                    domain_width = the.domain_width,
+                    rng = rng),
                 iters,
                 n_ech = 45,
                 n_pop = 100,
                 p_mut = 0.8,
                 p_cross = 0.2,
                 crossover = bit.crossover,
-                nb_sensors = the.nb_sensors
+                nb_sensors = the.nb_sensors,
+                batch_func = bit_batch,
+                snapshot = snapshot,
+                state = state,
+                screen = screen,
+                rng = rng
             )
         sensors = bit.to_sensors(sol)
 
     elif the.solver == "num_dict_evolution":
         val,sol = algo.evolution(
-                make.func(num.cover_sum,
-                    domain_width = the.domain_width,
-                    sensor_range = the.sensor_range,
-                    dim = d * the.nb_sensors),
+                num_func,
                 make.init(num.rand,
                     dim = d * the.nb_sensors,
-                    scale = the.domain_width),
+                    scale = the.domain_width,
+                    rng = rng),
                 make.neig(num.neighb_square,
                     scale = the.variation_scale,
-                    domain_width = the.domain_width),
+                    domain_width = the.domain_width,
+                    rng = rng),
                 iters,
                 n_ech = 45,
                 n_pop = 100,
                 p_mut = 0.8,
                 p_cross = 0,
                 crossover = num.crossover,
-                nb_sensors = the.nb_sensors
+                nb_sensors = the.nb_sensors,
+                batch_func = num_batch,
+                screen = screen,
+                rng = rng
+            )
+        sensors = num.to_sensors(sol)
+
+    elif the.solver == "sparse_greedy":
+        val,sol = algo.greedy(
+                sparse_delta if the.delta else sparse_func,
+                make.init(sparse.rand,
+                    domain_width = the.domain_width,
+                    nb_sensors = the.nb_sensors,
+                    rng = rng),
+                make.neig(sparse.neighb_square,
+                    scale = the.variation_scale,
+                    domain_width = the.domain_width,
+                    rng = rng),
+                iters
+            )
+        sensors = sparse.to_sensors(sol)
+
+    elif the.solver == "sparse_annealing":
+        val,sol = algo.annealing(
+                sparse_delta if the.delta else sparse_func,
+                make.init(sparse.rand,
+                    domain_width = the.domain_width,
+                    nb_sensors = the.nb_sensors,
+                    rng = rng),
+                make.neig(sparse.neighb_square,
+                    scale = the.variation_scale,
+                    domain_width = the.domain_width,
+                    rng = rng),
+                iters,
+                temperature0 = 1000,
+                Lambda = 0.99,
+                snapshot = snapshot,
+                state = state,
+                rng = rng
+            )
+        sensors = sparse.to_sensors(sol)
+
+    elif the.solver == "sparse_evolution":
+        val,sol = algo.evolution(
+                sparse_func,
+                make.init(sparse.rand,
+                    domain_width = the.domain_width,
+                    nb_sensors = the.nb_sensors,
+                    rng = rng),
+                make.neig(sparse.neighb_square,
+                    scale = the.variation_scale,
+                    domain_width = the.domain_width,
+                    rng = rng),
+                iters,
+                n_ech = 45,
+                n_pop = 100,
+                p_mut = 0.8,
+                p_cross = 0.2,
+                crossover = sparse.crossover,
+                nb_sensors = the.nb_sensors,
+                batch_func = sparse_batch,
+                snapshot = snapshot,
+                state = state,
+                screen = screen,
+                rng = rng
+            )
+        sensors = sparse.to_sensors(sol)
+
+    elif the.solver == "num_island_evolution":
+        val,sol = algo.island_evolution(
+                num_func,
+                make.init(num.rand,
+                    dim = d * the.nb_sensors,
+                    scale = the.domain_width,
+                    rng = rng),
+                make.neig(num.neighb_square,
+                    scale = the.variation_scale,
+                    domain_width = the.domain_width,
+                    rng = rng),
+                iters,
+                n_islands = the.islands,
+                period = the.migration_period,
+                n_migrants = 2,
+                topology = the.topology,
+                target = the.target,
+                n_ech = 45,
+                n_pop = 100,
+                p_mut = 0.8,
+                p_cross = 0.2,
+                crossover = num.crossover,
+                nb_sensors = the.nb_sensors,
+                batch_func = num_batch,
+                rng = rng
             )
         sensors = num.to_sensors(sol)
 
+    elif the.solver == "bit_island_evolution":
+        val,sol = algo.island_evolution(
+                bit_func,
+                make.init(bit.rand,
+                    domain_width = the.domain_width,
+                    nb_sensors = the.nb_sensors,
+                    rng = rng),
+                make.neig(bit.neighb_square,
+                    scale = the.variation_scale,
+                    domain_width = the.domain_width,
+                    rng = rng),
+                iters,
+                n_islands = the.islands,
+                period = the.migration_period,
+                n_migrants = 2,
+                topology = the.topology,
+                target = the.target,
+                n_ech = 45,
+                n_pop = 100,
+                p_mut = 0.8,
+                p_cross = 0.2,
+                crossover = bit.crossover,
+                nb_sensors = the.nb_sensors,
+                batch_func = bit_batch,
+                rng = rng
+            )
+        sensors = bit.to_sensors(sol)
+
+    if screen is not None and not the.ert :
+    	sys.stderr.write("\nScreening: {}".format(screen))
+
+    if the.cache > 0 and not the.ert :
+    	sys.stderr.write("\nCache: {}".format({"num": num_func, "bit": bit_func, "sparse": sparse_func}[the.solver.split("_")[0]]))
+
+    return val,sol,sensors
+
+
+def recorder(the):
+    """Make the recorder of the iterations of the solver named the.solver,
+    storing the solutions of the bit encoding as the coordinates of their sensors."""
+    return iters.recorder(
+                size = the.history,
+                policy = the.history_policy,
+                compact = sparse.from_dense if the.solver.startswith("bit") else None)
+
+
+def checkpoints(the, history):
+    """Make the common termination and checkpointing of the solver named the.solver,
+    recording its iterations in history (see recorder).
+    Return the stopping criterion, the saving checkpoint,
+    the stateful operators to be saved in snapshots
+    and the progress reporter to be stopped at the end (if any).
+    Files of portfolio workers are suffixed by their index."""
+    name = the.solver if the.worker is None else "{}.{}".format(the.solver, the.worker)
+    if the.binary:
+        save = iters.dump(name+".npy",
+                    improvements = the.improvements,
+                    dtype = np.uint8 if the.solver.startswith("bit") else None,
+                    append = the.resume)
+        trajectory = save
+    else:
+        save = make.iter(iters.save,
+                    filename = name+".csv",
+                    fmt = "{it} ; {val} ; {sol}\n")
+        # Erase the previous file, unless continuing it.
+        if not the.resume:
+            with open(name+".csv", 'w') as fd:
+                fd.write("# {} {}\n".format(the.solver,the.domain_width))
+        trajectory = iters.offset(name+".csv")
+
+    # Progress of parallel solvers would be mixed up.
+    report = None
+    if not the.portfolio:
+        report = iters.progress(period = the.progress, every = the.progress_every)
+    again = iters.pipeline(
+                nb_it = the.iters,
+                target = the.target,
+                nb_evals = the.budget,
+                delta = the.steady_delta,
+                epsilon = the.steady_epsilon,
+                hooks = [(save, the.save_period), history] + ([report] if report else []))
+    # Iterations saved after the last snapshot are dropped when resuming.
+    stateful = [again, history, trajectory]
+    if make.profiler is not None:
+        again = make.profiler.wrap("iter", again, again)
+    return again, save, stateful, report
+
+
+def solve(the, rng, best, done, results):
+    """Run the solver named the.solver in a worker process of a portfolio,
+    with the random number generator rng,
+    sharing its best value in best and stopping when done is set.
+    Put its name, best value, solution, sensors and history in results,
+    or its name, None and the error message if it failed (then stop the others)."""
+    try:
+        history = recorder(the)
+        again, save, _, _ = checkpoints(the, history)
+        val,sol,sensors = run(the, make.iter(iters.several,
+                    agains = [again, iters.shared(best, done, the.target)]), rng=rng)
+        if the.binary:
+            save.flush()
+        results.put((the.solver, val, sol, sensors, history))
+    except Exception:
+        done.set()
+        results.put((the.solver, None, traceback.format_exc(), None, None))
+
+
+def portfolio(the, solvers):
+    """Run the given solvers at the same time, in parallel processes,
+    with independent streams of random numbers derived from the.seed.
+    All of them stop as soon as one reaches the.target.
+    Return the best value found by all of them,
+    and the results of solve, by decreasing best values (failures last)."""
+    # Operators are closures, which are inherited by forked processes but cannot be pickled.
+    ctx = multiprocessing.get_context("fork")
+    best = ctx.Value('d', -np.inf)
+    done = ctx.Event()
+    results = ctx.Queue()
+    streams = np.random.default_rng(the.seed).spawn(len(solvers))
+    procs = []
+    for k,(solver,rng) in enumerate(zip(solvers,streams)) :
+    	proc = ctx.Process(target=solve, args=(argparse.Namespace(**dict(vars(the), solver=solver, worker=k)), rng, best, done, results))
+    	proc.start()
+    	procs.append(proc)
+    # Get the results before joining, as processes wait for their results to be consumed.
+    # Processes killed before putting their result (by a signal, for instance) would never put it.
+    res = []
+    while len(res) < len(procs):
+    	try:
+    		res.append(results.get(timeout=1))
+    	except queue.Empty:
+    		if all(proc.exitcode is not None for proc in procs):
+    			break
+    for proc in procs :
+    	proc.join()
+    if len(res) < len(procs):
+    	done.set()
+    	killed = [solver for solver,proc in zip(solvers,procs) if proc.exitcode != 0]
+    	res.append(("/".join(killed), None, "{} worker(s) exited without result".format(len(procs)-len(res)), None, None))
+    return best.value, sorted(res, key=lambda r: np.inf if r[1] is None else -r[1])
+
+
+if __name__=="__main__":
+    the = arguments().parse_args()
+
+    # Minimum checks.
+    assert(0 < the.nb_sensors)
+    assert(0 < the.sensor_range <= math.sqrt(2))
+    assert(0 < the.domain_width)
+    assert(0 < the.iters)
+    # Operators run in worker processes would not be profiled.
+    assert(not (the.portfolio and the.profile))
+    assert(not (the.portfolio and the.snapshot))
+    assert(the.snapshot or not the.resume)
+    # Other solvers would ignore their snapshot, and start over when resuming.
+    assert(not the.snapshot or the.solver in snapshots)
+    # Incremental evaluations ignore the line of sight.
+    assert(not (the.obstacles and the.delta))
+
+    # Do not forget the seed option,
+    # in case you would start "runs" in parallel.
+    rng = np.random.default_rng(the.seed)
+
+    if not the.ert :
+    	np.set_printoptions(linewidth = np.inf)
+
+    # Instrument the operators made from now on.
+    if the.profile:
+        make.profiler = make.profile()
+
+    start = time.perf_counter()
+    if the.portfolio:
+        best,results = portfolio(the, the.portfolio)
+        total = time.perf_counter() - start
+        for solver,val,sol,sensors,history in results:
+            if val is None:
+                sys.stderr.write("{} failed:\n{}\n".format(solver, sol))
+            else:
+                sys.stderr.write("{} : {}\n".format(solver, val))
+        sys.stderr.write("Best value shared by the portfolio: {}\n".format(best))
+        if results[0][1] is None:
+            sys.exit("All the solvers of the portfolio failed")
+        the.solver,val,sol,sensors,history = results[0]
+    else:
+        # Common termination and checkpointing.
+        history = recorder(the)
+        again,save,stateful,report = checkpoints(the, history)
+        snapshot,state = None,None
+        if the.snapshot:
+            snapshot = iters.snapshot(the.snapshot, the.snapshot_period, stateful, rng)
+            if the.resume:
+                state = iters.restore(the.snapshot, stateful, rng)
+        val,sol,sensors = run(the, again, snapshot, state, rng)
+        total = time.perf_counter() - start
+        report.stop()
+        if the.binary:
+            save.flush()
+
     if not the.ert :
     	print("\n{} : {}".format(val,sensors))
 
+    if the.profile == "-":
+        print("Total time: {:.6f} s\n{}".format(total, make.profiler))
+    elif the.profile:
+        with open(the.profile, 'w') as fd:
+            json.dump({"solver": the.solver, "value": float(val), "total": total,
+                       "operators": make.profiler.report()}, fd, indent=1)
+
     shape=(the.domain_width, the.domain_width)
+    vis = visibility(the.obstacles, the.sensor_range * the.domain_width, the.visibility) if the.obstacles else None
 
     fig = plt.figure()
 
@@ -281,17 +784,26 @@ if __name__=="__main__":
         ax1 = fig.add_subplot(121, projection='3d')
         ax2 = fig.add_subplot(122)
 
-        f = make.func(num.cover_sum,
+        f = make.batch_func(num.cover_sum_batch,
+                        domain_width = the.domain_width,
+                        sensor_range = the.sensor_range,
+                        dim = d,
+                        visibility = vis)
+        filename = None
+        if the.landscapes:
+            filename = plot.landscape_file(the.landscapes,
+                        objective = "num.cover_sum",
                         domain_width = the.domain_width,
-                        sensor_range = the.sensor_range * the.domain_width)
-        plot.surface(ax1, shape, f)
+                        sensor_range = the.sensor_range,
+                        obstacles = vis.digest() if vis else None)
+        plot.surface(ax1, shape, f, batch = True, processes = os.cpu_count(), filename = filename)
         plot.path(ax1, shape, history)
     else:
         ax2=fig.add_subplot(111)
 
     domain = np.zeros(shape)
     domain = pb.coverage(domain, sensors,
-            the.sensor_range * the.domain_width)
+            the.sensor_range * the.domain_width, vis)
     domain = plot.highlight_sensors(domain, sensors)
     ax2.imshow(domain)
     
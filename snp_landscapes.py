@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -10,6 +11,16 @@ def yonly_cover_sum(sol, domain_width, sensor_range, fixed_x = (10,30)):
     return np.sum(pb.coverage(domain, sensors, sensor_range))
 
 
+def yonly_cover_sum_batch(sols, domain_width, sensor_range, fixed_x = (10,30)):
+    """Compute the coverage quality of every vector of a population,
+    given as a (P,2) array, the sensors being on the cells of their floored coordinates."""
+    sols = np.floor(np.asarray(sols)).astype(int)
+    sensors = np.zeros((len(sols), 2, 2), dtype=int)
+    sensors[:,:,0] = np.floor(fixed_x).astype(int)
+    sensors[:,:,1] = sols
+    return pb.coverage_sum(sensors, domain_width, sensor_range)
+
+
 if __name__ == "__main__":
 
     d = 2
@@ -18,16 +29,13 @@ if __name__ == "__main__":
     r = 0.3 * w
 
     # Common termination and checkpointing.
-    history = []
-    iters = make.iter(
-                iters.several,
-                agains = [
-                    make.iter(iters.max,
-                        nb_it = 100),
+    history = iters.recorder()
+    iters = iters.pipeline(
+                nb_it = 100,
+                hooks = [
                     make.iter(iters.log,
                         fmt="\r{it} {val}"),
-                    make.iter(iters.history,
-                        history = history)
+                    history
                 ]
             )
 
@@ -56,10 +64,12 @@ if __name__ == "__main__":
     ax1 = fig.add_subplot(121, projection='3d')
     ax2 = fig.add_subplot(122)
 
-    f = make.func(yonly_cover_sum,
+    f = make.batch_func(yonly_cover_sum_batch,
                     domain_width = w,
                     sensor_range = r)
-    plot.surface(ax1, shape, f)
+    plot.surface(ax1, shape, f, batch = True, processes = os.cpu_count(),
+            filename = plot.landscape_file(objective = "yonly_cover_sum",
+                domain_width = w, sensor_range = r, fixed_x = (10,30)))
     plot.path(ax1, shape, history)
 
     domain = np.zeros(shape)